@@ -1,14 +1,48 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, session, Response, stream_with_context, abort, g, has_request_context
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.profiler import ProfilerMiddleware
 from openpyxl import Workbook, load_workbook
 from openpyxl.utils import get_column_letter
 import os
+import io
+import re
+import asyncio
+import atexit
+import csv
 import zipfile
+import zlib
 import shutil
+import struct
 import json
+import pstats
 import secrets
-from openai import OpenAI
+import bisect
+import hashlib
+import unicodedata
+import sqlite3
+import threading
+import time
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import click
+from contextlib import closing, contextmanager, asynccontextmanager
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from datetime import datetime
+from itertools import islice
+from urllib.parse import parse_qs
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow, uploaded images are stored as-is
+    Image = ImageOps = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SESSION_SECRET', 'dev-secret-key')
@@ -42,9 +76,409 @@ app.jinja_env.filters['format_harga'] = format_harga
 UPLOAD_FOLDER = 'uploads'
 EXCEL_FILE = os.path.join(UPLOAD_FOLDER, 'mass_upload_template.xlsx')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+EXCEL_ARCNAME = 'mass_upload_template.xlsx'
+# Manifest of what is already inside the ZIP (arcname, size, mtime) for incremental updates
+ARCHIVE_MANIFEST = os.path.join(UPLOAD_FOLDER, '.archive_manifest.json')
+# ARCHIVE_MODE: 'background' rebuilds the ZIP in a job after each write, 'eager' inside
+# the request, 'lazy' only marks it dirty and builds it on download
+ARCHIVE_MODE = os.environ.get('ARCHIVE_MODE', 'background').strip().lower()
+ARCHIVE_DIRTY_FLAG = os.path.join(UPLOAD_FOLDER, '.archive_dirty')
+ZIP_STREAM_CHUNK_SIZE = 64 * 1024
+# STORAGE_BACKEND: 'excel' keeps listings in the workbook, 'sqlite' keeps them in DB_FILE
+# and only generates the workbook when it is downloaded or zipped
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'excel').strip().lower()
+DB_FILE = os.path.join(UPLOAD_FOLDER, 'listings.db')
+# Lock file that serializes workbook/archive/store writers across gunicorn workers
+WRITE_LOCK_FILE = os.path.join(UPLOAD_FOLDER, '.write.lock')
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# ---------------------------------------------------------------------------
+# Request instrumentation. timed_phase() adds the duration of a phase (lock
+# wait, workbook load/save, image writes, ZIP, OpenAI call, ...) to the current
+# request; the totals go back as a Server-Timing header. With METRICS_ENABLED
+# the same timings also feed counters and histograms for /metrics: every
+# worker keeps its own in memory, flushes them to uploads/.metrics/ every
+# METRICS_FLUSH_SECONDS, and /metrics adds up the files of all workers. Files
+# of workers that are gone are folded into accumulated.json and deleted.
+# ---------------------------------------------------------------------------
+
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0').strip().lower() in ('1', 'true', 'yes', 'on')
+METRICS_FOLDER = os.path.join(UPLOAD_FOLDER, '.metrics')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+# Histogram upper bounds in seconds (the model calls need the long tail)
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_DESCRIPTIONS = {
+    'http_requests_total': ('counter', 'HTTP requests by route, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Time until the response is returned (streamed bodies excluded)'),
+    'phase_duration_seconds': ('histogram', 'Time spent per phase: lock_wait, workbook_load, workbook_save, images, zip, openai, ...'),
+    'openai_requests_total': ('counter', 'Model calls by kind and outcome'),
+    'openai_tokens_total': ('counter', 'Tokens reported by the model, by kind and type'),
+    'ai_cache_hits_total': ('counter', 'AI cache hits (all workers)'),
+    'ai_cache_misses_total': ('counter', 'AI cache misses (all workers)'),
+    'workbook_size_bytes': ('gauge', 'Size of the Excel workbook'),
+    'archive_size_bytes': ('gauge', 'Size of the current ZIP archive'),
+}
+
+_metrics_lock = threading.Lock()
+_metrics_counters = {}    # (name, labels) -> value
+_metrics_histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+_metrics_file = os.path.join(METRICS_FOLDER, f'{os.getpid()}-{secrets.token_hex(4)}.json')
+_metrics_owner = None  # flock'd <file>.lock held while this worker lives
+_metrics_last_flush = 0.0
+METRICS_ACCUMULATED_FILE = os.path.join(METRICS_FOLDER, 'accumulated.json')
+
+def metrics_inc(name, amount=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _metrics_counters[key] = _metrics_counters.get(key, 0) + amount
+
+def metrics_observe(name, seconds, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        histogram = _metrics_histograms.get(key)
+        if histogram is None:
+            histogram = _metrics_histograms[key] = [0] * (len(METRICS_BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+@contextmanager
+def timed_phase(name):
+    """Time a block as phase `name` of the current request (and of phase_duration_seconds)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if has_request_context():
+            timings = g.setdefault('phase_timings', {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+        metrics_observe('phase_duration_seconds', elapsed, phase=name)
+
+def record_openai_usage(kind, usage):
+    """Count one successful model call and the tokens it reported"""
+    metrics_inc('openai_requests_total', kind=kind, outcome='ok')
+    if usage is not None:
+        metrics_inc('openai_tokens_total', usage.prompt_tokens or 0, kind=kind, type='prompt')
+        metrics_inc('openai_tokens_total', usage.completion_tokens or 0, kind=kind, type='completion')
+
+def flush_metrics(force=False):
+    """Write this worker's counters and histograms to its file in METRICS_FOLDER"""
+    global _metrics_last_flush, _metrics_owner
+    now = time.monotonic()
+    if not METRICS_ENABLED or (not force and now - _metrics_last_flush < METRICS_FLUSH_INTERVAL):
+        return
+    # Image pool children import the app too, but never serve requests
+    if multiprocessing.parent_process() is not None:
+        return
+    _metrics_last_flush = now
+    with _metrics_lock:
+        if not _metrics_counters and not _metrics_histograms:
+            return
+        snapshot = {
+            'counters': [[name, labels, value] for (name, labels), value in _metrics_counters.items()],
+            'histograms': [[name, labels, list(values)] for (name, labels), values in _metrics_histograms.items()],
+        }
+    try:
+        os.makedirs(METRICS_FOLDER, exist_ok=True)
+        if _metrics_owner is None and fcntl:
+            # Locked before the file exists, so it is never mistaken for a dead worker's
+            _metrics_owner = open(_metrics_file[:-len('.json')] + '.lock', 'a')
+            fcntl.flock(_metrics_owner, fcntl.LOCK_EX)
+        with open(f'{_metrics_file}.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(f'{_metrics_file}.tmp', _metrics_file)
+    except OSError as e:
+        print(f"Warning: Could not write metrics: {e}")
+
+atexit.register(flush_metrics, True)
+
+def read_metrics_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def add_metrics(counters, histograms, data):
+    """Add the counters and histograms of one metrics file to the running totals"""
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in data.get('histograms', []):
+        key = (name, tuple(map(tuple, labels)))
+        if key in histograms:
+            histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+        else:
+            histograms[key] = values
+
+def fold_dead_metrics(names):
+    """Merge the files of workers that are gone (their .lock is free) into
+    METRICS_ACCUMULATED_FILE and delete them; returns the names still there.
+    Called with the folder lock held."""
+    accumulated = read_metrics_file(METRICS_ACCUMULATED_FILE) or {}
+    # Merged by an earlier fold that died before deleting them
+    merged = set(accumulated.get('folded', []))
+    counters, histograms = {}, {}
+    add_metrics(counters, histograms, accumulated)
+    dead = []
+    for file_name in names:
+        if file_name not in merged:
+            with open(os.path.join(METRICS_FOLDER, file_name[:-len('.json')] + '.lock'), 'a') as owner:
+                try:
+                    fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # worker still running
+            data = read_metrics_file(os.path.join(METRICS_FOLDER, file_name))
+            if data:
+                add_metrics(counters, histograms, data)
+        dead.append(file_name)
+    if not dead:
+        return names
+    tmp_file = METRICS_ACCUMULATED_FILE + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+            'folded': dead,
+        }, f)
+    os.replace(tmp_file, METRICS_ACCUMULATED_FILE)
+    for file_name in dead:
+        for path in (file_name, file_name[:-len('.json')] + '.lock'):
+            try:
+                os.remove(os.path.join(METRICS_FOLDER, path))
+            except FileNotFoundError:
+                pass
+    return [n for n in names if n not in dead]
+
+def collect_metrics():
+    """Counters and histograms summed over the files of every worker (dead ones included)"""
+    flush_metrics(force=True)
+    counters, histograms = {}, {}
+    try:
+        os.makedirs(METRICS_FOLDER, exist_ok=True)
+        folder_lock = open(os.path.join(METRICS_FOLDER, '.fold.lock'), 'a')
+    except OSError:
+        return counters, histograms
+    with folder_lock:
+        if fcntl:
+            # One scrape at a time, so a file is never counted both on its own and folded
+            fcntl.flock(folder_lock, fcntl.LOCK_EX)
+        names = [n for n in os.listdir(METRICS_FOLDER)
+                 if n.endswith('.json') and n != os.path.basename(METRICS_ACCUMULATED_FILE)]
+        if fcntl:
+            names = fold_dead_metrics(names)
+        for file_name in names + [os.path.basename(METRICS_ACCUMULATED_FILE)]:
+            data = read_metrics_file(os.path.join(METRICS_FOLDER, file_name))
+            if data:
+                add_metrics(counters, histograms, data)
+    return counters, histograms
+
+def format_metric_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+def render_metrics(counters, histograms, gauges):
+    """Prometheus text exposition format"""
+    series = {}
+    for (name, labels), value in counters.items():
+        series.setdefault(name, []).append(f'{name}{format_metric_labels(labels)} {value:g}')
+    for (name, labels), values in histograms.items():
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(METRICS_BUCKETS + (None,), values):
+            cumulative += count
+            le = '+Inf' if bound is None else f'{bound:g}'
+            lines.append(f'{name}_bucket{format_metric_labels(labels + (("le", le),))} {cumulative}')
+        lines.append(f'{name}_sum{format_metric_labels(labels)} {values[-1]:.6f}')
+        lines.append(f'{name}_count{format_metric_labels(labels)} {cumulative}')
+    for name, value in gauges.items():
+        series.setdefault(name, []).append(f'{name} {value:g}')
+    output = []
+    for name in sorted(series):
+        metric_type, description = METRIC_DESCRIPTIONS.get(name, ('untyped', name))
+        output += [f'# HELP {name} {description}', f'# TYPE {name} {metric_type}', *series[name]]
+    return '\n'.join(output) + '\n'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_timing(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    if SERVER_TIMING_ENABLED:
+        parts = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in g.get('phase_timings', {}).items()]
+        parts.append(f'total;dur={elapsed * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(parts)
+    if METRICS_ENABLED:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics_inc('http_requests_total', method=request.method, route=route, status=str(response.status_code))
+        metrics_observe('http_request_duration_seconds', elapsed, route=route)
+        flush_metrics()
+    return response
+
+# ---------------------------------------------------------------------------
+# On-demand profiling. With PROFILING_ENABLED=1 and a PROFILE_TOKEN, a request
+# that carries the token (X-Profile-Token header or ?profile_token=) runs under
+# cProfile through werkzeug's ProfilerMiddleware, which leaves a pstats dump in
+# PROFILE_FOLDER (snakeviz opens it, flameprof turns it into a flame graph).
+# Profiled responses are buffered, so streamed bodies arrive in one piece.
+# /profiles lists the recent dumps with their hottest functions.
+# ---------------------------------------------------------------------------
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0').strip().lower() in ('1', 'true', 'yes', 'on')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '').strip()
+PROFILE_FOLDER = os.environ.get('PROFILE_DIR') or os.path.join(UPLOAD_FOLDER, '.profiles')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '50'))
+PROFILE_TOP_FUNCTIONS = 10
+# ProfilerMiddleware's default name: {method}.{path with dots}.{elapsed}ms.{unix time}.prof
+PROFILE_FILENAME_RE = re.compile(r'^(?P<method>[A-Z]+)\.(?P<path>.*)\.(?P<elapsed>\d+)ms\.(?P<time>\d+)\.prof$')
+
+if PROFILING_ENABLED and not PROFILE_TOKEN:
+    print("Warning: PROFILING_ENABLED is set but PROFILE_TOKEN is empty, profiling stays off")
+
+def has_profile_token(token):
+    if not (PROFILING_ENABLED and PROFILE_TOKEN and token):
+        return False
+    return secrets.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+def prune_profiles():
+    """Keep only the newest PROFILE_MAX_FILES dumps"""
+    try:
+        paths = [os.path.join(PROFILE_FOLDER, n) for n in os.listdir(PROFILE_FOLDER) if n.endswith('.prof')]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[PROFILE_MAX_FILES:]:
+            os.remove(path)
+    except OSError as e:
+        print(f"Warning: Could not prune profiles: {e}")
+
+def profile_requests(wsgi_app):
+    """Wrap a WSGI app so that requests with the profile token run under the profiler"""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    profiled_app = ProfilerMiddleware(wsgi_app, stream=None, profile_dir=PROFILE_FOLDER)
+    
+    def dispatch(environ, start_response):
+        token = (environ.get('HTTP_X_PROFILE_TOKEN')
+                 or parse_qs(environ.get('QUERY_STRING', '')).get('profile_token', [''])[0])
+        # The profile index itself is never profiled
+        if environ.get('PATH_INFO', '').startswith('/profiles') or not has_profile_token(token):
+            return wsgi_app(environ, start_response)
+        try:
+            return profiled_app(environ, start_response)
+        finally:
+            prune_profiles()
+    return dispatch
+
+def summarize_profile(path):
+    """Total time and the functions with the most own time in one dump"""
+    stats = pstats.Stats(path)
+    functions = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        location = name if filename == '~' else f'{name} ({os.path.basename(filename)}:{line})'
+        functions.append({'function': location, 'calls': calls,
+                          'own_ms': own * 1000, 'cumulative_ms': cumulative * 1000})
+    functions.sort(key=lambda f: f['own_ms'], reverse=True)
+    return {'total_ms': stats.total_tt * 1000, 'functions': functions[:PROFILE_TOP_FUNCTIONS]}
+
+def list_profiles(limit=20):
+    """Newest dumps first, with request info parsed from the file name"""
+    try:
+        names = [n for n in os.listdir(PROFILE_FOLDER) if PROFILE_FILENAME_RE.match(n)]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in sorted(names, key=lambda n: int(PROFILE_FILENAME_RE.match(n)['time']), reverse=True)[:limit]:
+        match = PROFILE_FILENAME_RE.match(name)
+        try:
+            summary = summarize_profile(os.path.join(PROFILE_FOLDER, name))
+        except Exception as e:
+            print(f"Warning: Could not read profile {name}: {e}")
+            continue
+        profiles.append({
+            'filename': name,
+            'method': match['method'],
+            'path': '/' + match['path'].replace('.', '/') if match['path'] != 'root' else '/',
+            'elapsed_ms': int(match['elapsed']),
+            'date': datetime.fromtimestamp(int(match['time'])).strftime('%d-%b-%Y %H:%M:%S'),
+            **summary,
+        })
+    return profiles
+
+if PROFILING_ENABLED and PROFILE_TOKEN:
+    app.wsgi_app = profile_requests(app.wsgi_app)
+
+_write_lock = threading.RLock()
+_write_lock_state = threading.local()
+
+@contextmanager
+def write_lock():
+    """Hold the exclusive writer lock (re-entrant). Readers never take it:
+    the workbook is replaced atomically, so they always see a complete file."""
+    with _write_lock:
+        depth = getattr(_write_lock_state, 'depth', 0)
+        if depth == 0 and fcntl:
+            _write_lock_state.file = open(WRITE_LOCK_FILE, 'a')
+            with timed_phase('lock_wait'):
+                fcntl.flock(_write_lock_state.file, fcntl.LOCK_EX)
+        _write_lock_state.depth = depth + 1
+        try:
+            yield
+        finally:
+            _write_lock_state.depth = depth
+            if depth == 0 and fcntl:
+                fcntl.flock(_write_lock_state.file, fcntl.LOCK_UN)
+                _write_lock_state.file.close()
+
+def with_write_lock(func):
+    """Decorator: run the function while holding the writer lock"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with write_lock():
+            return func(*args, **kwargs)
+    return wrapper
+
+def save_workbook(wb, path=None):
+    """Save a workbook via a temp file and atomic rename, so readers never see a partial file"""
+    path = path or EXCEL_FILE
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    wb.save(tmp_file)
+    # Flush to disk before the rename so a confirmed write survives a crash
+    with open(tmp_file, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+def write_workbook_streaming(sheets, path=None, keep=None):
+    """Write a whole workbook in openpyxl's write-only mode and save it like save_workbook.
+
+    sheets yields (sheet_name, headers, rows) with rows any iterable of value
+    lists. Each row is serialized as soon as it is appended, so memory stays
+    flat however many listings there are (nothing can be edited afterwards).
+    keep, if given, is asked once all rows are written; when it returns False
+    the new workbook is dropped and the file on disk stays as it was.
+    """
+    wb = Workbook(write_only=True)
+    for sheet_name, headers, rows in sheets:
+        ws = wb.create_sheet(sheet_name)
+        ws.append(headers)
+        for values in rows:
+            ws.append(values)
+    if keep is None or keep():
+        save_workbook(wb, path)
+    else:
+        wb.save(io.BytesIO())  # still finish it, so openpyxl removes its temp files
+
 def get_zip_filename():
     """Generate ZIP filename with human-readable timestamp: upl_{DD-MMM-YYYY_HH-MM-SS}"""
     timestamp = datetime.now().strftime('%d-%b-%Y_%H-%M-%S')
@@ -52,11 +486,16 @@ def get_zip_filename():
 
 def get_current_zip_file():
     """Get the most recent ZIP file or generate new filename"""
+    # Prefer the archive tracked by the incremental manifest
+    archive = load_archive_manifest().get('archive')
+    if archive and os.path.exists(os.path.join(UPLOAD_FOLDER, archive)):
+        return os.path.join(UPLOAD_FOLDER, archive)
+    
     # Look for most recent upl_*.zip file
     try:
         files = [f for f in os.listdir(UPLOAD_FOLDER) if f.startswith('upl_') and f.endswith('.zip')]
         if files:
-            files.sort(reverse=True)
+            files.sort(key=lambda f: os.path.getmtime(os.path.join(UPLOAD_FOLDER, f)), reverse=True)
             return os.path.join(UPLOAD_FOLDER, files[0])
     except:
         pass
@@ -243,57 +682,217 @@ try:
 except Exception:
     CONFIG_OPENAI_API_KEY = None
 
-def get_openai_client():
-    """Get or initialize OpenAI client (lazy loading for Render compatibility)"""
+# One client per process: keep-alive connections are reused across requests.
+# The SDK retries 429/5xx/connection errors with exponential backoff (honouring Retry-After).
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT_SECONDS', '60'))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT_SECONDS', '10'))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '3'))
+# Max in-flight model calls across all worker processes (one flock'd slot file each);
+# callers wait up to OPENAI_QUEUE_TIMEOUT for a slot
+OPENAI_MAX_CONCURRENCY = int(os.environ.get('OPENAI_MAX_CONCURRENCY', '8'))
+OPENAI_QUEUE_TIMEOUT = float(os.environ.get('OPENAI_QUEUE_TIMEOUT_SECONDS', '30'))
+OPENAI_SLOT_DIR = os.path.join(UPLOAD_FOLDER, '.openai_slots')
+
+_openai_client = None
+_openai_client_lock = threading.Lock()
+# Threads of one process queue here first, so at most OPENAI_MAX_CONCURRENCY of them poll the slot files
+_openai_limiter = threading.BoundedSemaphore(OPENAI_MAX_CONCURRENCY)
+
+def get_openai_api_key():
     api_key = os.environ.get('OPENAI_API_KEY') or CONFIG_OPENAI_API_KEY
     if not api_key:
         raise Exception("OpenAI API key tidak tersedia. Silakan tambahkan OPENAI_API_KEY di environment variables.")
-    return OpenAI(api_key=api_key)
+    return api_key
 
-def generate_professional_listing(data, tipe_properti):
-    """Generate professional judul_iklan and deskripsi_iklan using AI"""
-    client = get_openai_client()
-    
+def get_openai_client_options():
+    return {
+        'api_key': get_openai_api_key(),
+        'timeout': httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        'max_retries': OPENAI_MAX_RETRIES,
+    }
+
+def get_openai_client():
+    """Get the shared OpenAI client (created lazily on first use for Render compatibility)"""
+    global _openai_client
+    if _openai_client is None:
+        with _openai_client_lock:
+            if _openai_client is None:
+                _openai_client = OpenAI(**get_openai_client_options())
+    return _openai_client
+
+def acquire_openai_slot(timeout=OPENAI_QUEUE_TIMEOUT):
+    """Take one of the OPENAI_MAX_CONCURRENCY slots shared by all worker processes.
+
+    Returns a handle for release_openai_slot(), or None after timeout seconds.
+    Without fcntl (Windows) the limit only holds within this process.
+    """
+    deadline = time.monotonic() + timeout
+    if not _openai_limiter.acquire(timeout=timeout):
+        return None
+    if not fcntl:
+        return True
+    os.makedirs(OPENAI_SLOT_DIR, exist_ok=True)
+    start = os.getpid() + threading.get_ident()  # spread first attempts over the slots
+    delay = 0.01
     try:
-        # Build context from form data
-        context_parts = [f"Tipe Properti: {tipe_properti}"]
-        
-        # Add key specifications
-        specs = {
-            'luas_tanah': data.get('luas_tanah', ''),
-            'luas_bangunan': data.get('luas_bangunan', ''),
-            'kamar_tidur': data.get('kamar_tidur', ''),
-            'kamar_mandi': data.get('kamar_mandi', ''),
-            'jumlah_lantai': data.get('jumlah_lantai', ''),
-            'carport': data.get('carport', ''),
-            'harga': data.get('harga', ''),
-            'kategori': data.get('kategori', ''),
-            'periode_sewa': data.get('periode_sewa', ''),
-            'id_area': data.get('id_area', ''),
-            'selling_point': data.get('selling_point', ''),
-            'fasilitas_lingkungan': data.get('fasilitas_lingkungan', ''),
-            'fasilitas_ruko': data.get('fasilitas_ruko', ''),
-            'fasilitas_pabrik': data.get('fasilitas_pabrik', ''),
-            'fasilitas_gudang': data.get('fasilitas_gudang', ''),
-            'fasilitas_perkantoran': data.get('fasilitas_perkantoran', ''),
-            'fasilitas_ruang_usaha': data.get('fasilitas_ruang_usaha', ''),
-            'kondisi_properti': data.get('kondisi_properti', ''),
-            'sertifikat': data.get('sertifikat', ''),
-        }
-        
-        # Build context string
-        for key, value in specs.items():
-            if value:
-                context_parts.append(f"{key}: {value}")
-        
-        context = "\n".join(context_parts)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Kamu adalah agen properti profesional dan marketer terbaik yang sangat memahami cara menjual properti.
+        while True:
+            for i in range(OPENAI_MAX_CONCURRENCY):
+                slot_file = open(os.path.join(OPENAI_SLOT_DIR, f'slot-{(start + i) % OPENAI_MAX_CONCURRENCY}.lock'), 'a')
+                try:
+                    fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return slot_file
+                except BlockingIOError:
+                    slot_file.close()
+            # Every slot is held by another process: back off, like a SQLite busy timeout
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _openai_limiter.release()
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.2)
+    except BaseException:
+        _openai_limiter.release()
+        raise
+
+def release_openai_slot(slot):
+    if slot is not True:
+        fcntl.flock(slot, fcntl.LOCK_UN)
+        slot.close()
+    _openai_limiter.release()
+
+@contextmanager
+def openai_slot():
+    """Hold one of the OPENAI_MAX_CONCURRENCY slots for the duration of a model call"""
+    with timed_phase('openai_wait'):
+        slot = acquire_openai_slot()
+    if slot is None:
+        raise Exception("Terlalu banyak permintaan AI bersamaan, silakan coba lagi sebentar lagi.")
+    try:
+        with timed_phase('openai'):
+            yield
+    finally:
+        release_openai_slot(slot)
+
+@asynccontextmanager
+async def async_openai_slot():
+    """openai_slot() for coroutines: waits for the slot in a thread, off the event loop"""
+    waiter = asyncio.ensure_future(asyncio.to_thread(acquire_openai_slot))
+    try:
+        slot = await asyncio.shield(waiter)
+    except asyncio.CancelledError:
+        # The thread keeps waiting; give back whatever slot it ends up with
+        waiter.add_done_callback(
+            lambda w: w.cancelled() or w.exception() or w.result() is None or release_openai_slot(w.result()))
+        raise
+    if slot is None:
+        raise Exception("Terlalu banyak permintaan AI bersamaan, silakan coba lagi sebentar lagi.")
+    try:
+        with timed_phase('openai'):
+            yield
+    finally:
+        release_openai_slot(slot)
+
+# Model used for parsing and listing generation (part of the AI cache key)
+OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o')
+
+# ---------------------------------------------------------------------------
+# AI response cache: table ai_cache in DB_FILE, shared by all workers.
+# Key = sha256(kind, model, system prompt, whitespace-normalized input), so
+# editing a prompt or switching model never serves stale answers.
+# ---------------------------------------------------------------------------
+
+AI_CACHE_ENABLED = os.environ.get('AI_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '5000'))
+
+def ai_cache_key(kind, system_prompt, text):
+    digest = hashlib.sha256()
+    for part in (kind, OPENAI_MODEL, system_prompt, ' '.join(str(text).split())):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def incr_meta(conn, key, amount=1):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+        (key, amount)
+    )
+
+def ai_cache_get(key):
+    """Cached result for key (None on miss or expiry); counts hits and misses"""
+    try:
+        now = time.time()
+        with closing(get_db()) as conn, conn:
+            row = conn.execute("SELECT value FROM ai_cache WHERE key = ? AND created_at >= ?",
+                               (key, now - AI_CACHE_TTL)).fetchone()
+            if row is None:
+                incr_meta(conn, 'ai_cache_misses')
+                return None
+            conn.execute("UPDATE ai_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            incr_meta(conn, 'ai_cache_hits')
+        return json.loads(row['value'])
+    except sqlite3.Error as e:
+        print(f"Warning: AI cache read failed: {e}")
+        return None
+
+def ai_cache_put(key, kind, value):
+    """Store a result, then drop expired entries and least recently used ones over the limit"""
+    try:
+        now = time.time()
+        with closing(get_db()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, kind, value, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (key, kind, json.dumps(value), now, now)
+            )
+            conn.execute("DELETE FROM ai_cache WHERE created_at < ?", (now - AI_CACHE_TTL,))
+            conn.execute(
+                "DELETE FROM ai_cache WHERE key IN ("
+                "SELECT key FROM ai_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (AI_CACHE_MAX_ENTRIES,)
+            )
+    except sqlite3.Error as e:
+        print(f"Warning: AI cache write failed: {e}")
+
+def cached_ai_call(kind, system_prompt, text, call, use_cache=True):
+    """Return call() through the AI cache; use_cache=False skips the lookup but refreshes the entry"""
+    if not AI_CACHE_ENABLED:
+        return call()
+    key = ai_cache_key(kind, system_prompt, text)
+    if use_cache:
+        cached = ai_cache_get(key)
+        if cached is not None:
+            return cached
+    result = call()
+    if 'error' not in result:
+        ai_cache_put(key, kind, result)
+    return result
+
+def ai_cache_stats():
+    with closing(get_db()) as conn:
+        entries = conn.execute("SELECT kind, COUNT(*) AS n FROM ai_cache GROUP BY kind").fetchall()
+        hits = int(get_meta(conn, 'ai_cache_hits', 0))
+        misses = int(get_meta(conn, 'ai_cache_misses', 0))
+    return {
+        'enabled': AI_CACHE_ENABLED,
+        'entries': {row['kind']: row['n'] for row in entries},
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'ttl_seconds': AI_CACHE_TTL,
+        'max_entries': AI_CACHE_MAX_ENTRIES,
+    }
+
+@app.cli.command('clear-ai-cache')
+def clear_ai_cache_command():
+    """Remove all cached AI responses and reset the hit/miss counters."""
+    with closing(get_db()) as conn, conn:
+        removed = conn.execute("DELETE FROM ai_cache").rowcount
+        conn.execute("DELETE FROM meta WHERE key IN ('ai_cache_hits', 'ai_cache_misses')")
+    click.echo(f'{removed} respons AI dihapus dari cache')
+
+LISTING_SYSTEM_PROMPT = """Kamu adalah agen properti profesional dan marketer terbaik yang sangat memahami cara menjual properti.
 Tugasmu adalah membuat judul listing dan deskripsi yang menarik, profesional, dan persuasif.
 
 ATURAN PENTING:
@@ -325,38 +924,87 @@ Respond ONLY dengan JSON object mengandung:
   "kalimat_pembuka": "...",
   "deskripsi_iklan": "..."
 }"""
-                },
-                {
-                    "role": "user",
-                    "content": f"Buatkan judul dan deskripsi profesional untuk properti dengan detail berikut:\n\n{context}"
-                }
-            ],
-            response_format={"type": "json_object"}
-        )
+
+def build_listing_context(data, tipe_properti):
+    """Build the property summary the listing generator writes from"""
+    context_parts = [f"Tipe Properti: {tipe_properti}"]
+    
+    # Add key specifications
+    specs = {
+        'luas_tanah': data.get('luas_tanah', ''),
+        'luas_bangunan': data.get('luas_bangunan', ''),
+        'kamar_tidur': data.get('kamar_tidur', ''),
+        'kamar_mandi': data.get('kamar_mandi', ''),
+        'jumlah_lantai': data.get('jumlah_lantai', ''),
+        'carport': data.get('carport', ''),
+        'harga': data.get('harga', ''),
+        'kategori': data.get('kategori', ''),
+        'periode_sewa': data.get('periode_sewa', ''),
+        'id_area': data.get('id_area', ''),
+        'selling_point': data.get('selling_point', ''),
+        'fasilitas_lingkungan': data.get('fasilitas_lingkungan', ''),
+        'fasilitas_ruko': data.get('fasilitas_ruko', ''),
+        'fasilitas_pabrik': data.get('fasilitas_pabrik', ''),
+        'fasilitas_gudang': data.get('fasilitas_gudang', ''),
+        'fasilitas_perkantoran': data.get('fasilitas_perkantoran', ''),
+        'fasilitas_ruang_usaha': data.get('fasilitas_ruang_usaha', ''),
+        'kondisi_properti': data.get('kondisi_properti', ''),
+        'sertifikat': data.get('sertifikat', ''),
+    }
+    
+    # Build context string
+    for key, value in specs.items():
+        if value:
+            context_parts.append(f"{key}: {value}")
+    
+    return "\n".join(context_parts)
+
+def generate_professional_listing(data, tipe_properti, use_cache=True):
+    """Generate professional judul_iklan and deskripsi_iklan using AI"""
+    context = build_listing_context(data, tipe_properti)
+    return cached_ai_call('listing', LISTING_SYSTEM_PROMPT, context,
+                          lambda: _generate_professional_listing(context), use_cache)
+
+def build_listing_messages(context):
+    return [
+        {
+            "role": "system",
+            "content": LISTING_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"Buatkan judul dan deskripsi profesional untuk properti dengan detail berikut:\n\n{context}"
+        }
+    ]
+
+def finalize_listing_result(result):
+    return {
+        'judul_iklan': result.get('judul_iklan', ''),
+        'kalimat_pembuka': result.get('kalimat_pembuka', ''),
+        'deskripsi_iklan': result.get('deskripsi_iklan', '')
+    }
+
+def _generate_professional_listing(context):
+    client = get_openai_client()
+    
+    try:
+        with openai_slot():
+            response = client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=build_listing_messages(context),
+                response_format={"type": "json_object"}
+            )
         
+        record_openai_usage('listing', response.usage)
         result = json.loads(response.choices[0].message.content)
-        return {
-            'judul_iklan': result.get('judul_iklan', ''),
-            'kalimat_pembuka': result.get('kalimat_pembuka', ''),
-            'deskripsi_iklan': result.get('deskripsi_iklan', '')
-        }
+        return finalize_listing_result(result)
     except Exception as e:
+        metrics_inc('openai_requests_total', kind='listing', outcome='error')
         error_msg = f"Professional Listing Generator Error: {str(e)}"
         print(error_msg)
         return {'error': error_msg}
 
-def parse_listing_with_ai(description):
-    client = get_openai_client()
-    
-    try:
-        # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
-        # do not change this unless explicitly requested by the user
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Kamu adalah asisten AI yang membantu mengekstrak informasi properti dari deskripsi teks.
+PARSER_SYSTEM_PROMPT = """Kamu adalah asisten AI yang membantu mengekstrak informasi properti dari deskripsi teks.
 Analisa deskripsi properti dan ekstrak informasi berikut dalam format JSON.
 Jika informasi tidak tersedia atau tidak jelas, gunakan string kosong "".
 
@@ -471,22 +1119,572 @@ PENTING:
 - deskripsi_iklan HARUS berisi informasi lengkap dan menarik, bukan hanya ringkasan singkat
 - Gunakan PLAIN TEXT tanpa markdown atau emoji
 - Respond ONLY with valid JSON object, no additional text."""
-                },
-                {
-                    "role": "user",
-                    "content": f"Deskripsi properti: {description}"
-                }
-            ],
-            response_format={"type": "json_object"}
+
+def build_parser_messages(description, known_fields=None):
+    """Chat messages for the parser; with known_fields the model is asked only for what is missing"""
+    content = f"Deskripsi properti: {description}"
+    if known_fields is not None:
+        content += (
+            "\n\nField berikut sudah diekstrak otomatis: "
+            f"{json.dumps(known_fields, ensure_ascii=False)}"
+            f"\nKembalikan field berikut: {', '.join(missing_parser_fields(known_fields))}"
+            "\nSertakan field yang sudah diekstrak HANYA jika nilainya jelas keliru menurut deskripsi."
         )
+    return [
+        {
+            "role": "system",
+            "content": PARSER_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
+
+# ---------------------------------------------------------------------------
+# Rule-based pre-extractor: the pattern-matching part of parsing (LT/LB/KT/KM,
+# SHM, "Rp 1,5 M", "disewa per tahun", furnished, ...) done locally in
+# microseconds. PARSER_MODE decides what is left for the model:
+#   ai      - model extracts everything (no pre-extraction)
+#   hybrid  - model only fills the fields the rules did not find, plus the prose
+#   offline - no model call; prose is assembled from the extracted fields
+# ---------------------------------------------------------------------------
+
+PARSER_MODES = ('ai', 'hybrid', 'offline')
+PARSER_MODE = os.environ.get('PARSER_MODE', 'hybrid').strip().lower()
+PROSE_FIELDS = ['judul_iklan', 'deskripsi_iklan', 'selling_point']
+# Global fields that show up in listing texts (status/aktivasi/sundul never do)
+EXTRACTABLE_GLOBAL_FIELDS = [
+    'tipe_properti', 'kategori', 'jenis_properti', 'id_area', 'harga', 'periode_sewa',
+    'sertifikat', 'kondisi_properti', 'kondisi_perabotan'
+]
+
+NUMBER_PATTERN = r'\d[\d.,]*'
+PRICE_MULTIPLIERS = {
+    'triliun': 10**12, 't': 10**12,
+    'miliar': 10**9, 'milyar': 10**9, 'm': 10**9,
+    'juta': 10**6, 'jt': 10**6,
+    'ribu': 10**3, 'rb': 10**3, 'k': 10**3,
+}
+PRICE_RE = re.compile(
+    r'(?:\bharga(?:\s+(?:jual|sewa))?\s*:?\s*(?:rp\.?|idr)?|\brp\.?|\bidr)\s*'
+    r'(' + NUMBER_PATTERN + r')\s*(triliun|miliar|milyar|juta|jt|ribu|rb|m|k|t)?(?![\w²])',
+    re.IGNORECASE
+)
+# Without "Rp"/"harga" only unambiguous units count ("1,5 M" but never "500 m2")
+BARE_PRICE_RE = re.compile(r'\b(' + NUMBER_PATTERN + r')\s*((?i:miliar|milyar|juta|jt)|M)(?![\w²])')
+RENT_PERIOD_RE = re.compile(
+    r'(?:/|\bper\s*|\bse)(tahun|thn|th|bulan|bln|hari|malam)\b|\b(tahunan|bulanan|harian)\b',
+    re.IGNORECASE
+)
+RENT_PERIODS = {
+    'tahun': 'per tahun', 'thn': 'per tahun', 'th': 'per tahun', 'tahunan': 'per tahun',
+    'bulan': 'per bulan', 'bln': 'per bulan', 'bulanan': 'per bulan',
+    'hari': 'per hari', 'malam': 'per hari', 'harian': 'per hari',
+}
+LT_LB_RE = re.compile(r'\bLT\s*/\s*LB\s*:?\s*(' + NUMBER_PATTERN + r')\s*/\s*(' + NUMBER_PATTERN + r')', re.IGNORECASE)
+LAND_AREA_RE = re.compile(
+    r'\b(?:LT|luas\s+(?:tanah|lahan))\s*[:=]?\s*(' + NUMBER_PATTERN + r')\s*(m²|m2|meter|are|ha|hektar)?',
+    re.IGNORECASE
+)
+AREA_ONLY_RE = re.compile(r'\b(' + NUMBER_PATTERN + r')\s*(m²|m2|meter\s+persegi|are|ha|hektar)(?!\w)', re.IGNORECASE)
+BUILDING_AREA_RE = re.compile(r'\b(?:LB|luas\s+bangunan)\s*[:=]?\s*(' + NUMBER_PATTERN + r')', re.IGNORECASE)
+BEDROOM_RE = re.compile(
+    r'\b(\d+)(?:\s*\+\s*(\d+))?\s*(?:KT|kamar\s+tidur|kmr\s+tidur|bedrooms?|BR)\b'
+    r'|\b(?:KT|kamar\s+tidur)\s*[:=]?\s*(\d+)(?:\s*\+\s*(\d+))?\b',
+    re.IGNORECASE
+)
+# Upper-case KM only: "2 km dari tol" is a distance
+BATHROOM_RE = re.compile(
+    r'\b(\d+)\s*(?:(?i:kamar\s+mandi|kmr\s+mandi|bathrooms?)|KM(?!\s*(?:dari|ke|menuju)\b))\b'
+    r'|\b(?:(?i:kamar\s+mandi)|KM)\s*[:=]?\s*(\d+)\b(?!\s*(?i:km|meter|menit))'
+)
+FLOORS_RE = re.compile(r'\b(' + NUMBER_PATTERN + r')\s*(?:lantai|tingkat|floors?|storey)\b', re.IGNORECASE)
+FLOOR_NUMBER_RE = re.compile(r'\blantai\s*(?:ke[-\s]*)?(\d+)\b', re.IGNORECASE)
+CARPORT_RE = re.compile(
+    r'\b(\d+)\s*(?:car\s*port|garasi)\b|\b(?:car\s*port|garasi)\s*[:=]?\s*(\d+)\b',
+    re.IGNORECASE
+)
+# The name stops before a price ("di Sentul Rp 300rb") or a number
+AREA_RE = re.compile(
+    r'\b(?:di|daerah|lokasi|area|kawasan|wilayah)\s*:?\s+'
+    r'((?!Jl\b|Jalan\b)[A-Z][a-z]+(?:\s+(?!Rp\b|Idr\b|Harga\b)[A-Z][a-z]+){0,2})\b'
+)
+
+# Keyword tables: {value: [phrases]} matched word by word on the lower-cased text.
+# Phrases mapped to None are skipped ("luas tanah" is not a tanah listing).
+TIPE_KEYWORDS = {
+    'kost': ['rumah kost', 'rumah kos', 'rumah kosan', 'kost', 'kos', 'kosan', 'boarding house'],
+    'rumah': ['rumah', 'rmh', 'house', 'townhouse'],
+    'apartemen': ['apartemen', 'apartment', 'apt', 'kondominium', 'condo'],
+    'tanah': ['tanah', 'kavling', 'kaveling', 'lahan'],
+    'ruko': ['ruko', 'rukan', 'shophouse'],
+    'villa': ['villa', 'vila'],
+    'hotel': ['hotel', 'guest house', 'guesthouse', 'losmen', 'homestay'],
+    'pabrik': ['pabrik', 'factory'],
+    'gudang': ['gudang', 'warehouse'],
+    'perkantoran': ['perkantoran', 'kantor', 'office'],
+    'ruang_usaha': ['ruang usaha', 'kios'],
+    'gedung': ['gedung'],
+    None: ['luas tanah', 'luas lahan', 'sertifikat tanah'],
+}
+KATEGORI_KEYWORDS = {
+    'dijual': ['dijual', 'di jual', 'djual', 'jual', 'for sale'],
+    'disewa': ['disewa', 'disewakan', 'di sewakan', 'sewa', 'for rent', 'dikontrakkan', 'dikontrakan', 'kontrakan'],
+}
+JENIS_KEYWORDS = {
+    'aset_bank': ['aset bank', 'lelang', 'cessie'],
+    'second': ['second', 'seken', 'bekas', '2nd'],
+    'baru': ['rumah baru', 'unit baru', 'bangunan baru', 'properti baru', 'villa baru', 'ruko baru',
+             'brand new', 'baru gres', 'gres', 'gress'],
+}
+SERTIFIKAT_KEYWORDS = {
+    'SHM': ['shm', 'hak milik'],
+    'HGB': ['hgb', 'shgb', 'hak guna bangunan', 'hak guna bangun'],
+    'HGU': ['hgu', 'hak guna usaha'],
+    'HP': ['hak pakai'],
+    'HS': ['hak sewa'],
+    'PPJB': ['ppjb'],
+    'Strata': ['strata', 'strata title'],
+    'Girik': ['girik'],
+    'Adat': ['tanah adat', 'adat'],
+}
+KONDISI_KEYWORDS = {
+    'Butuh Renovasi Total': ['butuh renovasi total', 'perlu renovasi total'],
+    'Butuh Minim Renovasi': ['butuh renovasi', 'perlu renovasi', 'butuh sedikit renovasi', 'perlu sedikit renovasi',
+                             'butuh minim renovasi'],
+    'Terenovasi': ['sudah direnovasi', 'habis renovasi', 'baru direnovasi', 'terenovasi'],
+    'Bagus': ['kondisi bagus', 'kondisi sangat bagus', 'kondisi baik', 'kondisi prima', 'terawat', 'siap huni'],
+}
+PERABOTAN_KEYWORDS = {
+    'Semi Furnished': ['semi furnished', 'semi furnish', 'semifurnished', 'semifurnish'],
+    'Unfurnished': ['unfurnished', 'unfurnish', 'non furnished', 'non furnish', 'tidak furnished', 'tidak furnish',
+                    'tanpa furnish', 'tanpa perabot', 'kosongan'],
+    'Furnished': ['fully furnished', 'full furnished', 'full furnish', 'furnished', 'furnish', 'full perabot'],
+}
+KEYWORD_TOKEN_RE = re.compile(r'[a-z0-9]+')
+# A keyword right after one of these is negated ("tidak furnished", "bukan shm") and skipped
+NEGATION_WORDS = {'tidak', 'tdk', 'non', 'bukan', 'tanpa'}
+
+def _compile_keywords(keywords):
+    """{value: [phrases]} -> {first word: [(words, priority, value)]}, longest phrase first"""
+    table = {}
+    for priority, (value, phrases) in enumerate(keywords.items()):
+        for phrase in phrases:
+            words = tuple(phrase.split())
+            table.setdefault(words[0], []).append((words, priority, value))
+    for candidates in table.values():
+        candidates.sort(key=lambda candidate: -len(candidate[0]))
+    return table
+
+TIPE_KEYWORDS = _compile_keywords(TIPE_KEYWORDS)
+KATEGORI_KEYWORDS = _compile_keywords(KATEGORI_KEYWORDS)
+JENIS_KEYWORDS = _compile_keywords(JENIS_KEYWORDS)
+SERTIFIKAT_KEYWORDS = _compile_keywords(SERTIFIKAT_KEYWORDS)
+KONDISI_KEYWORDS = _compile_keywords(KONDISI_KEYWORDS)
+PERABOTAN_KEYWORDS = _compile_keywords(PERABOTAN_KEYWORDS)
+
+def _keyword_matches(table, words):
+    """(priority, value) of every keyword phrase in the word list, left to right"""
+    idx = 0
+    while idx < len(words):
+        for phrase, priority, value in table.get(words[idx], ()):
+            if tuple(words[idx:idx + len(phrase)]) == phrase:
+                if value is not None and (idx == 0 or words[idx - 1] not in NEGATION_WORDS):
+                    yield priority, value
+                idx += len(phrase)
+                break
+        else:
+            idx += 1
+
+def parse_id_number(text):
+    """'1.500.000' -> 1500000, '1,5' -> 1.5, '1,500,000' -> 1500000 (Indonesian and English separators)"""
+    text = text.strip('.,')
+    if re.fullmatch(r'\d{1,3}(?:\.\d{3})+(?:,\d+)?', text):
+        text = text.replace('.', '').replace(',', '.')
+    elif re.fullmatch(r'\d{1,3}(?:,\d{3})+(?:\.\d+)?', text):
+        text = text.replace(',', '')
+    else:
+        text = text.replace(',', '.')
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else number
+
+def _first_keyword(table, words):
+    """Value of the keyword that appears earliest in the text"""
+    return next((value for priority, value in _keyword_matches(table, words)), None)
+
+def _first_listed_keyword(table, words):
+    """Value of the first keyword (in table order) that appears in the text"""
+    matches = list(_keyword_matches(table, words))
+    return min(matches)[1] if matches else None
+
+def _extract_price(text):
+    for regex in (PRICE_RE, BARE_PRICE_RE):
+        for match in regex.finditer(text):
+            number = parse_id_number(match.group(1))
+            if number is None:
+                continue
+            unit = (match.group(2) or '').lower()
+            price = number * PRICE_MULTIPLIERS.get(unit, 1)
+            if price >= 1000:
+                return int(price)
+    return None
+
+def extract_listing_fields(text):
+    """Deterministically extract the pattern-like fields of a listing text.
+
+    Returns only the fields that were found, as the AI parser would name them.
+    """
+    fields = {}
+    words = KEYWORD_TOKEN_RE.findall(text.lower())
+    
+    tipe_properti = _first_keyword(TIPE_KEYWORDS, words)
+    kategori = _first_keyword(KATEGORI_KEYWORDS, words)
+    simple_fields = {
+        'tipe_properti': tipe_properti,
+        'kategori': kategori,
+        'jenis_properti': _first_listed_keyword(JENIS_KEYWORDS, words),
+        'sertifikat': _first_listed_keyword(SERTIFIKAT_KEYWORDS, words),
+        'kondisi_properti': _first_listed_keyword(KONDISI_KEYWORDS, words),
+        'kondisi_perabotan': _first_listed_keyword(PERABOTAN_KEYWORDS, words),
+    }
+    fields.update({key: value for key, value in simple_fields.items() if value})
+    
+    match = AREA_RE.search(text)
+    if match:
+        fields['id_area'] = match.group(1)
+    
+    harga = _extract_price(text)
+    if harga:
+        fields['harga'] = harga
+    if kategori == 'disewa':
+        match = RENT_PERIOD_RE.search(text)
+        if match:
+            fields['periode_sewa'] = RENT_PERIODS[(match.group(1) or match.group(2)).lower()]
+    
+    match = LT_LB_RE.search(text)
+    if match:
+        fields['luas_tanah'] = parse_id_number(match.group(1))
+        fields['luas_bangunan'] = parse_id_number(match.group(2))
+    land_match = LAND_AREA_RE.search(text)
+    if land_match and 'luas_tanah' not in fields:
+        fields['luas_tanah'] = parse_id_number(land_match.group(1))
+    if tipe_properti == 'tanah':
+        if not land_match:
+            land_match = AREA_ONLY_RE.search(text)
+            if land_match:
+                fields['luas_tanah'] = parse_id_number(land_match.group(1))
+        unit = (land_match.group(2) or '').lower() if land_match else ''
+        if unit:
+            fields['satuan_tanah'] = 'are' if unit == 'are' else 'ha' if unit in ('ha', 'hektar') else 'm2'
+        match = re.search(r'(?:/|\bper\s*)(m2|m²|meter|are|ha)\b', text, re.IGNORECASE)
+        if match:
+            unit = match.group(1).lower()
+            fields['satuan_harga'] = '/are' if unit == 'are' else '/ha' if unit == 'ha' else '/m2'
+    match = BUILDING_AREA_RE.search(text)
+    if match and 'luas_bangunan' not in fields:
+        fields['luas_bangunan'] = parse_id_number(match.group(1))
+    
+    match = BEDROOM_RE.search(text)
+    if match:
+        main, extra = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+        fields['kamar_tidur'] = int(main) + int(extra or 0)
+    match = BATHROOM_RE.search(text)
+    if match:
+        fields['kamar_mandi'] = int(match.group(1) or match.group(2))
+    if tipe_properti == 'apartemen':
+        match = FLOOR_NUMBER_RE.search(text)
+        if match:
+            fields['nomor_lantai'] = match.group(1)
+    else:
+        match = FLOORS_RE.search(text)
+        if match:
+            fields['jumlah_lantai'] = parse_id_number(match.group(1))
+    match = CARPORT_RE.search(text)
+    if match:
+        fields['carport'] = int(match.group(1) or match.group(2))
+    
+    # Keep only what the detected type actually has
+    if tipe_properti:
+        allowed = set(EXTRACTABLE_GLOBAL_FIELDS) | set(SPECIFIC_COLUMNS.get(tipe_properti, []))
+        fields = {key: value for key, value in fields.items() if key in allowed}
+    return {key: value for key, value in fields.items() if value is not None}
+
+def missing_parser_fields(fields):
+    """Fields the model still has to provide after pre-extraction (always includes the prose)"""
+    wanted = list(EXTRACTABLE_GLOBAL_FIELDS)
+    if fields.get('kategori') == 'dijual':
+        wanted.remove('periode_sewa')
+    wanted += SPECIFIC_COLUMNS.get(fields.get('tipe_properti'), [])
+    return [field for field in wanted if field not in fields] + PROSE_FIELDS
+
+def build_offline_listing(fields, description):
+    """Fill the prose fields without the model: title from the extracted fields, original text as description"""
+    parts = [' '.join(filter(None, [
+        (fields.get('tipe_properti') or 'Properti').replace('_', ' ').title(),
+        (fields.get('kategori') or '').title(),
+        f"di {fields['id_area']}" if fields.get('id_area') else '',
+    ]))]
+    if fields.get('luas_tanah'):
+        parts.append(f"LT {fields['luas_tanah']}")
+    if fields.get('kamar_tidur'):
+        parts.append(f"{fields['kamar_tidur']}KT")
+    if fields.get('harga'):
+        parts.append(f"Rp {format_harga(fields['harga'])}")
+    judul = ''
+    for part in parts:
+        candidate = f'{judul}, {part}' if judul else part
+        if len(candidate) > 52:
+            break
+        judul = candidate
+    return {
+        **fields,
+        'judul_iklan': judul,
+        'deskripsi_iklan': description.strip(),
+    }
+
+def resolve_parser_mode(mode=None):
+    mode = (mode or PARSER_MODE or 'hybrid').strip().lower()
+    return mode if mode in PARSER_MODES else 'hybrid'
+
+def build_parse_request(description, mode):
+    """(pre-extracted fields, messages for the model or None when no model call is needed)"""
+    if mode == 'ai':
+        return {}, build_parser_messages(description)
+    fields = extract_listing_fields(description)
+    if mode == 'offline':
+        return fields, None
+    return fields, build_parser_messages(description, fields)
+
+def merge_parsed_fields(fields, result):
+    """Pre-extracted fields filled in with the model's answer; a non-empty model value wins"""
+    return {**fields, **{k: v for k, v in result.items() if v not in (None, '')}}
+
+def parse_listing_with_ai(description, use_cache=True, mode=None):
+    mode = resolve_parser_mode(mode)
+    fields, messages = build_parse_request(description, mode)
+    if messages is None:
+        return build_offline_listing(fields, description)
+    # The user message carries the pre-extracted fields, so it is the cache key text
+    result = cached_ai_call(f'parse-{mode}', PARSER_SYSTEM_PROMPT, messages[-1]['content'],
+                            lambda: _parse_listing_with_ai(messages), use_cache)
+    if 'error' in result:
+        return result
+    return merge_parsed_fields(fields, result)
+
+def _parse_listing_with_ai(messages):
+    client = get_openai_client()
+    
+    try:
+        with openai_slot():
+            response = client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                response_format={"type": "json_object"}
+            )
         
+        record_openai_usage('parse', response.usage)
         result = json.loads(response.choices[0].message.content)
         return result
     except Exception as e:
+        metrics_inc('openai_requests_total', kind='parse', outcome='error')
         error_msg = f"AI Parser Error: {str(e)}"
         print(error_msg)
         return {'error': error_msg}
 
+# ---------------------------------------------------------------------------
+# Streaming (Server-Sent Events): the model streams its JSON object and the
+# fields decoded so far are pushed to the browser as they grow.
+# ---------------------------------------------------------------------------
+
+SSE_FLUSH_INTERVAL = 0.1  # seconds between 'partial' events
+_PARTIAL_KEY_RE = re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)"\s*:\s*')
+_PARTIAL_STRING_RE = re.compile(r'"((?:[^"\\]|\\.)*)(")?')
+_PARTIAL_SCALAR_RE = re.compile(r'(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)(?=\s*[,}])')
+
+def parse_partial_json_object(buffer):
+    """Fields of a flat JSON object that is still being written; the last string may be cut off"""
+    fields = {}
+    pos = buffer.find('{')
+    if pos < 0:
+        return fields
+    pos += 1
+    while True:
+        match = _PARTIAL_KEY_RE.match(buffer, pos)
+        if not match:
+            return fields
+        key = match.group(1)
+        pos = match.end()
+        if buffer.startswith('"', pos):
+            match = _PARTIAL_STRING_RE.match(buffer, pos)
+            raw, closed = match.group(1), match.group(2)
+            if not closed:
+                # Drop an escape sequence that was split between chunks
+                raw = re.sub(r'\\u[0-9a-fA-F]{0,3}$', '', raw)
+            try:
+                fields[key] = json.loads(f'"{raw}"', strict=False)
+            except ValueError:
+                return fields
+            if not closed:
+                return fields
+            pos = match.end()
+        else:
+            match = _PARTIAL_SCALAR_RE.match(buffer, pos)
+            if not match:
+                return fields
+            fields[key] = json.loads(match.group(1))
+            pos = match.end()
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_ai_json(kind, system_prompt, text, messages, finalize=None, use_cache=True, prefill=None):
+    """Yield SSE events for a JSON-mode completion.
+
+    'partial' carries the fields that changed since the previous event, 'done' the
+    complete result (served straight from the AI cache when possible), 'error' a message.
+    prefill (pre-extracted fields) is sent first; the model's non-empty values replace it.
+    """
+    prefill = prefill or {}
+    if prefill:
+        yield sse_event('partial', prefill)
+    key = ai_cache_key(kind, system_prompt, text) if AI_CACHE_ENABLED else None
+    if key and use_cache:
+        cached = ai_cache_get(key)
+        if cached is not None:
+            yield sse_event('done', merge_parsed_fields(prefill, cached))
+            return
+    
+    try:
+        client = get_openai_client()
+        with openai_slot():
+            with client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+                stream=True,
+                stream_options={"include_usage": True}
+            ) as stream:
+                buffer, sent, last_flush, usage = '', dict(prefill), 0.0, None
+                for chunk in stream:
+                    usage = chunk.usage or usage
+                    if not chunk.choices:
+                        continue
+                    buffer += chunk.choices[0].delta.content or ''
+                    now = time.monotonic()
+                    if now - last_flush < SSE_FLUSH_INTERVAL:
+                        continue
+                    changed = {k: v for k, v in parse_partial_json_object(buffer).items()
+                               if v not in (None, '') and sent.get(k) != v}
+                    if changed:
+                        sent.update(changed)
+                        last_flush = now
+                        yield sse_event('partial', changed)
+        record_openai_usage(kind.split('-')[0], usage)
+        result = json.loads(buffer)
+        if finalize:
+            result = finalize(result)
+    except Exception as e:
+        metrics_inc('openai_requests_total', kind=kind.split('-')[0], outcome='error')
+        error_msg = f"AI Stream Error: {str(e)}"
+        print(error_msg)
+        yield sse_event('error', {'error': error_msg})
+        return
+    
+    if key:
+        ai_cache_put(key, kind, result)
+    yield sse_event('done', merge_parsed_fields(prefill, result))
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Batch parsing: max concurrent requests to the model for one batch
+AI_BATCH_CONCURRENCY = int(os.environ.get('AI_BATCH_CONCURRENCY', '8'))
+AI_BATCH_MAX_LISTINGS = int(os.environ.get('AI_BATCH_MAX_LISTINGS', '60'))
+# WhatsApp export line headers: "[12/10/24, 10.15] Nama: ..." or "12/10/24 10.15 - Nama: ..."
+WHATSAPP_HEADER_RE = re.compile(
+    r'^\[?\d{1,2}/\d{1,2}/\d{2,4},?\s+\d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s*[AP]M)?\]?\s*(?:-\s*)?[^:\n]{1,40}:\s?',
+    re.MULTILINE | re.IGNORECASE
+)
+LISTING_SEPARATOR_RE = re.compile(r'\n\s*(?:[-=_*~]{3,}\s*\n|\n\s*\n)')
+MIN_LISTING_LENGTH = 20
+
+def split_listing_dump(text):
+    """Split a pasted dump (e.g. a WhatsApp chat export) into individual listing texts"""
+    text = text.replace('\r\n', '\n').strip()
+    if WHATSAPP_HEADER_RE.search(text):
+        # One listing per chat message
+        blocks = WHATSAPP_HEADER_RE.split(text)
+    else:
+        # Separator lines (---, ===, ***) or two blank lines, else single blank lines
+        blocks = LISTING_SEPARATOR_RE.split(text)
+        if len(blocks) == 1:
+            blocks = re.split(r'\n\s*\n', text)
+    return [block.strip() for block in blocks if len(block.strip()) >= MIN_LISTING_LENGTH]
+
+def get_async_openai_client():
+    # Bound to the event loop of one batch, so not shared like get_openai_client()
+    return AsyncOpenAI(**get_openai_client_options())
+
+async def _parse_listings_async(message_lists):
+    semaphore = asyncio.Semaphore(AI_BATCH_CONCURRENCY)
+    
+    async with get_async_openai_client() as client:
+        async def parse_one(messages):
+            async with semaphore:
+                try:
+                    async with async_openai_slot():
+                        response = await client.chat.completions.create(
+                            model=OPENAI_MODEL,
+                            messages=messages,
+                            response_format={"type": "json_object"}
+                        )
+                    record_openai_usage('parse', response.usage)
+                    return json.loads(response.choices[0].message.content)
+                except Exception as e:
+                    metrics_inc('openai_requests_total', kind='parse', outcome='error')
+                    error_msg = f"AI Parser Error: {str(e)}"
+                    print(error_msg)
+                    return {'error': error_msg}
+        
+        return await asyncio.gather(*(parse_one(m) for m in message_lists))
+
+def parse_listings_batch(descriptions, use_cache=True, mode=None):
+    """Parse many descriptions concurrently (bounded by AI_BATCH_CONCURRENCY).
+
+    Returns one result per description, in order: parsed fields or {'error': ...}.
+    Cached descriptions are answered from the AI cache; only the rest hit the model.
+    """
+    mode = resolve_parser_mode(mode)
+    kind = f'parse-{mode}'
+    parse_requests = [build_parse_request(d, mode) for d in descriptions]
+    results = [None] * len(descriptions)
+    keys = [None] * len(descriptions)
+    for idx, (fields, messages) in enumerate(parse_requests):
+        if messages is None:
+            results[idx] = build_offline_listing(fields, descriptions[idx])
+            continue
+        keys[idx] = ai_cache_key(kind, PARSER_SYSTEM_PROMPT, messages[-1]['content'])
+        if AI_CACHE_ENABLED and use_cache:
+            results[idx] = ai_cache_get(keys[idx])
+    
+    pending = [idx for idx, result in enumerate(results) if result is None]
+    if pending:
+        parsed = asyncio.run(_parse_listings_async([parse_requests[idx][1] for idx in pending]))
+        for idx, result in zip(pending, parsed):
+            results[idx] = result
+            if AI_CACHE_ENABLED and 'error' not in result:
+                ai_cache_put(keys[idx], kind, result)
+    
+    for idx, (fields, messages) in enumerate(parse_requests):
+        if messages is not None and 'error' not in results[idx]:
+            results[idx] = merge_parsed_fields(fields, results[idx])
+    return results
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -509,14 +1707,18 @@ def validate_tipe_properti(tipe_properti):
 def init_excel(tipe_properti=None):
     """Initialize Excel file with appropriate columns for property type"""
     # Create main file if doesn't exist
-    if not os.path.exists(EXCEL_FILE):
+    if os.path.exists(EXCEL_FILE):
+        return
+    with write_lock():
+        if os.path.exists(EXCEL_FILE):
+            return
         wb = Workbook()
         ws = wb.active
         ws.title = "Data Properti"
         columns = get_excel_columns()
         for idx, col in enumerate(columns, 1):
             ws.cell(row=1, column=idx, value=col)
-        wb.save(EXCEL_FILE)
+        save_workbook(wb)
 
 def get_sheet_name(tipe_properti):
     """Get the sheet name based on property type (lowercase)"""
@@ -538,8 +1740,351 @@ def get_sheet_name(tipe_properti):
     }
     return sheet_name_map.get(tipe_normalized, 'data_properti')
 
-def get_next_no(tipe_properti=None):
-    """Get the next number for entry for specific property type"""
+# ---------------------------------------------------------------------------
+# SQLite database (DB_FILE): per-type number sequences for every backend, and the
+# listing store for STORAGE_BACKEND=sqlite, where the workbook is only
+# materialized for download/ZIP.
+# ---------------------------------------------------------------------------
+
+_db_schema_ready = False
+_db_schema_lock = threading.Lock()
+
+def get_db():
+    """Open a connection to the SQLite database (schema is created on first use)"""
+    global _db_schema_ready
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if not _db_schema_ready:
+        with _db_schema_lock:
+            if not _db_schema_ready:
+                init_db_schema(conn)
+                _db_schema_ready = True
+    return conn
+
+def init_db_schema(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS sheets (
+            name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            headers TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS listings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sheet TEXT NOT NULL,
+            tipe TEXT NOT NULL,
+            no TEXT NOT NULL,
+            data TEXT NOT NULL,
+            kategori TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL DEFAULT '',
+            area TEXT NOT NULL DEFAULT '',
+            harga REAL,
+            sheet_position INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_listings_key ON listings (tipe, no);
+        CREATE INDEX IF NOT EXISTS idx_listings_sheet ON listings (sheet, no);
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            next_no INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_cache (last_used);
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            dedupe_key TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            run_after REAL NOT NULL,
+            started_at REAL,
+            lease_until REAL,
+            finished_at REAL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key) WHERE status = 'queued';
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after);
+        CREATE TABLE IF NOT EXISTS image_sources (
+            source_key TEXT PRIMARY KEY,
+            digest TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_image_sources_digest ON image_sources (digest);
+    """)
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS listing_search USING fts5("
+            "tipe UNINDEXED, no UNINDEXED, judul, area, selling_point, deskripsi, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        # Excel store: stable FTS rowids per (tipe, no), so updates and deletes are keyed lookups
+        conn.execute("CREATE TABLE IF NOT EXISTS search_keys ("
+                     "id INTEGER PRIMARY KEY, tipe TEXT NOT NULL, no TEXT NOT NULL, UNIQUE (tipe, no))")
+    except sqlite3.OperationalError as e:  # SQLite built without FTS5
+        print(f"Warning: Full-text search not available: {str(e)}")
+    # Databases from before the listing filters: add and backfill the filter columns
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(listings)")}
+    if 'harga' not in columns:
+        for column in ("kategori TEXT NOT NULL DEFAULT ''", "status TEXT NOT NULL DEFAULT ''",
+                       "area TEXT NOT NULL DEFAULT ''", "harga REAL",
+                       "sheet_position INTEGER NOT NULL DEFAULT 0"):
+            conn.execute(f"ALTER TABLE listings ADD COLUMN {column}")
+        conn.executemany(
+            "UPDATE listings SET kategori = ?, status = ?, area = ?, harga = ?, "
+            "sheet_position = (SELECT position FROM sheets WHERE name = listings.sheet) WHERE id = ?",
+            [(*listing_filter_values(json.loads(row['data'])), row['id'])
+             for row in conn.execute("SELECT id, data FROM listings").fetchall()]
+        )
+    # The ORDER BY clauses of _query_listing_db, so a page is read straight from an index
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_listings_order ON listings (sheet_position, id);
+        CREATE INDEX IF NOT EXISTS idx_listings_harga_asc ON listings (harga IS NULL, harga, id);
+        CREATE INDEX IF NOT EXISTS idx_listings_harga_desc ON listings (harga IS NULL, harga DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_listings_kategori ON listings (kategori);
+        CREATE INDEX IF NOT EXISTS idx_listings_status ON listings (status);
+        CREATE INDEX IF NOT EXISTS idx_listings_area ON listings (area);
+    """)
+    conn.commit()
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else default
+
+def set_meta(conn, key, value):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, str(value))
+    )
+
+def bump_data_version(conn):
+    """Mark the materialized workbook as outdated"""
+    set_meta(conn, 'data_version', int(get_meta(conn, 'data_version', 0)) + 1)
+
+def db_ensure_sheet(conn, sheet_name, tipe_properti=None):
+    """Return headers of a sheet, creating it with the per-type columns if needed"""
+    row = conn.execute("SELECT headers FROM sheets WHERE name = ?", (sheet_name,)).fetchone()
+    if row:
+        return json.loads(row['headers'])
+    headers = list(get_excel_columns(tipe_properti))
+    position = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM sheets").fetchone()[0]
+    conn.execute("INSERT INTO sheets (name, position, headers) VALUES (?, ?, ?)",
+                 (sheet_name, position, json.dumps(headers)))
+    return headers
+
+def db_insert_row(conn, sheet_name, headers, values):
+    item = dict(zip(headers, values))
+    tipe = item.get('tipe properti') or item.get('tipe_properti', '')
+    cursor = conn.execute(
+        "INSERT INTO listings (sheet, tipe, no, data, kategori, status, area, harga, sheet_position) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT position FROM sheets WHERE name = ?))",
+        (sheet_name, *listing_key(tipe, item.get('no')), json.dumps(item, default=str),
+         *listing_filter_values(item), sheet_name)
+    )
+    search_index_put(conn, item, rowid=cursor.lastrowid)
+
+_listing_store_ready = False
+
+def init_listing_store():
+    """Create the default sheet and import an existing workbook once (sqlite backend)"""
+    global _listing_store_ready
+    if _listing_store_ready:
+        return
+    with closing(get_db()) as conn, conn:
+        if get_meta(conn, 'migrated') is None:
+            if os.path.exists(EXCEL_FILE):
+                migrate_excel_to_sqlite(conn)
+            set_meta(conn, 'migrated', datetime.now().isoformat())
+        # Same first sheet init_excel() creates for a new workbook
+        db_ensure_sheet(conn, "Data Properti")
+    _listing_store_ready = True
+
+def read_sheet_rows(ws):
+    """(first row, data rows) of a read-only sheet. Data rows are padded to the width
+    of the first row: openpyxl only pads them by itself when the file records its
+    dimensions, and workbooks written in write-only mode don't."""
+    first_row = next(ws.iter_rows(max_row=1, values_only=True), None) or ()
+    return first_row, ws.iter_rows(min_row=2, max_col=len(first_row) or None, values_only=True)
+
+def migrate_excel_to_sqlite(conn, excel_file=None):
+    """Import every sheet of an existing workbook into the listing store, keeping its layout"""
+    wb = load_workbook(excel_file or EXCEL_FILE, read_only=True)
+    imported = 0
+    try:
+        for sheet_name in wb.sheetnames:
+            first_row, row_iter = read_sheet_rows(wb[sheet_name])
+            headers = [value for value in first_row if value]
+            position = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM sheets").fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO sheets (name, position, headers) VALUES (?, ?, ?)",
+                         (sheet_name, position, json.dumps(headers)))
+            for row in row_iter:
+                if row and row[0]:  # Only if 'no' is not empty
+                    db_insert_row(conn, sheet_name, headers, row)
+                    imported += 1
+    finally:
+        wb.close()
+    bump_data_version(conn)
+    return imported
+
+def db_read_rows():
+    """All listings as header-keyed dicts, in sheet order then insertion order"""
+    init_listing_store()
+    with closing(get_db()) as conn:
+        rows = conn.execute(
+            "SELECT l.data FROM listings l JOIN sheets s ON s.name = l.sheet "
+            "ORDER BY s.position, l.id"
+        ).fetchall()
+    return [json.loads(row['data']) for row in rows]
+
+def iter_db_sheets(conn):
+    """(sheet_name, headers, rows) per sheet of the listing store; rows are read lazily"""
+    sheets = conn.execute("SELECT name, headers FROM sheets ORDER BY position").fetchall()
+    for sheet in sheets:
+        headers = json.loads(sheet['headers'])
+        cursor = conn.execute("SELECT data FROM listings WHERE sheet = ? ORDER BY id", (sheet['name'],))
+        yield sheet['name'], headers, _db_sheet_values(cursor, headers)
+
+def _db_sheet_values(cursor, headers):
+    for row in cursor:
+        item = json.loads(row['data'])
+        yield [item.get(header) for header in headers]
+
+@with_write_lock
+@timed_phase('excel_export')
+def export_excel_from_db():
+    """Materialize the workbook from the listing store if it is outdated"""
+    init_listing_store()
+    with closing(get_db()) as conn:
+        version = get_meta(conn, 'data_version', '0')
+        if get_meta(conn, 'exported_version') == version and os.path.exists(EXCEL_FILE):
+            return
+        write_workbook_streaming(iter_db_sheets(conn))
+        with conn:
+            set_meta(conn, 'exported_version', version)
+
+def ensure_excel_export():
+    """Make sure EXCEL_FILE reflects the current data before it is read as a file"""
+    if STORAGE_BACKEND == 'sqlite':
+        export_excel_from_db()
+    else:
+        init_excel()
+
+@with_write_lock
+def reset_listing_store():
+    """Remove every listing from the store (used by reset-all)"""
+    with closing(get_db()) as conn, conn:
+        conn.execute("DELETE FROM listings")
+        conn.execute("DELETE FROM sheets")
+        if search_index_ready(conn):
+            conn.execute("DELETE FROM listing_search")
+        db_ensure_sheet(conn, "Data Properti")
+        bump_data_version(conn)
+
+@app.cli.command('migrate-excel')
+@click.option('--force', is_flag=True, help='Replace listings already in the database.')
+def migrate_excel_command(force):
+    """Import mass_upload_template.xlsx into the SQLite listing store."""
+    if not os.path.exists(EXCEL_FILE):
+        click.echo(f'{EXCEL_FILE} tidak ditemukan')
+        return
+    with closing(get_db()) as conn, conn:
+        if get_meta(conn, 'migrated') is not None and not force:
+            click.echo('Workbook sudah pernah diimpor, gunakan --force untuk mengimpor ulang')
+            return
+        conn.execute("DELETE FROM listings")
+        conn.execute("DELETE FROM sheets")
+        if search_index_ready(conn):
+            conn.execute("DELETE FROM listing_search")
+        imported = migrate_excel_to_sqlite(conn)
+        # Counters may be past (or behind) the imported numbers: the next
+        # get_next_no() seeds them again from the new rows and upload folders
+        conn.execute("DELETE FROM sequences")
+        set_meta(conn, 'migrated', datetime.now().isoformat())
+    click.echo(f'{imported} listing diimpor ke {DB_FILE}')
+
+def db_get_next_no(tipe_properti=None):
+    """Next number for a property type from the listing store"""
+    if not tipe_properti:
+        return 1
+    init_listing_store()
+    sheet_name = get_sheet_name(normalize_tipe_properti(tipe_properti))
+    max_no = 1
+    with closing(get_db()) as conn:
+        for row in conn.execute("SELECT no FROM listings WHERE sheet = ?", (sheet_name,)):
+            try:
+                max_no = max(max_no, int(row['no']) + 1)
+            except (ValueError, TypeError):
+                pass
+    return max_no
+
+def get_next_no(tipe_properti=None, count=1):
+    """Allocate the next number(s) for a property type.
+
+    Numbers come from a persistent per-type counter in DB_FILE. The counter is
+    read and advanced inside one IMMEDIATE transaction, so concurrent workers
+    never hand out the same number. On first use it is seeded from the sheet
+    (and any existing upload folders). Returns the first of `count` reserved numbers.
+    """
+    if not tipe_properti:
+        # If no property type specified, default to 1
+        return 1
+    sheet_name = get_sheet_name(normalize_tipe_properti(tipe_properti))
+    # Both may write, so keep them out of the transaction below
+    if STORAGE_BACKEND == 'sqlite':
+        init_listing_store()
+    else:
+        init_excel()
+    
+    conn = get_db()
+    conn.isolation_level = None  # manage the transaction explicitly
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT next_no FROM sequences WHERE name = ?", (sheet_name,)).fetchone()
+        next_no = row['next_no'] if row else seed_next_no(tipe_properti)
+        conn.execute(
+            "INSERT INTO sequences (name, next_no) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET next_no = excluded.next_no",
+            (sheet_name, next_no + count)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return next_no
+
+def reset_sequences():
+    """Forget all counters so numbering starts from the data again (used by reset-all)"""
+    with closing(get_db()) as conn, conn:
+        conn.execute("DELETE FROM sequences")
+
+def seed_next_no(tipe_properti):
+    """Initial counter value: past the highest number in the sheet and in uploads/{tipe}/"""
+    next_no = scan_next_no(tipe_properti)
+    property_root = os.path.join(UPLOAD_FOLDER, normalize_tipe_properti(tipe_properti))
+    if os.path.isdir(property_root):
+        for name in os.listdir(property_root):
+            if name.isdigit():
+                next_no = max(next_no, int(name) + 1)
+    return next_no
+
+def scan_next_no(tipe_properti=None):
+    """Get the next number for entry for specific property type by scanning the sheet"""
+    if STORAGE_BACKEND == 'sqlite':
+        return db_get_next_no(tipe_properti)
     init_excel()
     try:
         wb = load_workbook(EXCEL_FILE)
@@ -567,32 +2112,373 @@ def get_next_no(tipe_properti=None):
     except:
         return 1
 
-def read_excel_data():
-    """Read all data from all sheets in Excel"""
-    init_excel()
+# In-process cache of parsed workbook rows, keyed by the workbook's (mtime, size)
+_listing_cache = {'stamp': None, 'rows': [], 'by_sheet': {}, 'by_key': {}}
+_listing_cache_lock = threading.Lock()
+
+def get_excel_stamp():
+    """Return (mtime_ns, size) of the Excel file, or None if it doesn't exist"""
     try:
-        wb = load_workbook(EXCEL_FILE)
-        data = []
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            # Get headers from first row
-            headers = []
-            for cell in ws[1]:
-                if cell.value:
-                    headers.append(cell.value)
-            
-            # Read data rows
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if row[0]:  # Only if 'no' is not empty
-                    data.append(dict(zip(headers, row)))
-        wb.close()  # Ensure workbook is closed
-        return data
-    except:
-        return []
+        st = os.stat(EXCEL_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
 
-def create_header_mapping(tipe_properti):
-    """Create mapping from Excel header (with spaces) to field name (with underscores)"""
-    mapping = {
+def listing_key(tipe_properti, no):
+    """Lookup key for a listing: (lowercase tipe, no as string)"""
+    return (str(tipe_properti or '').strip().lower(), str(no).strip())
+
+def invalidate_listing_cache():
+    """Drop cached rows; call after writing the workbook"""
+    with _listing_cache_lock:
+        _listing_cache['stamp'] = None
+
+def get_listing_cache():
+    """Return the row cache, re-parsing the workbook only when it changed on disk"""
+    init_excel()
+    with _listing_cache_lock:
+        stamp = get_excel_stamp()
+        if stamp is not None and _listing_cache['stamp'] == stamp:
+            return _listing_cache
+        
+        rows, by_sheet, by_key = [], {}, {}
+        with timed_phase('workbook_read'):
+            try:
+                wb = load_workbook(EXCEL_FILE, read_only=True)
+                for sheet_name in wb.sheetnames:
+                    ws = wb[sheet_name]
+                    sheet_rows = by_sheet.setdefault(sheet_name, [])
+                    # Get headers from first row
+                    first_row, row_iter = read_sheet_rows(ws)
+                    headers = [value for value in first_row if value]
+                
+                    # Read data rows
+                    for row in row_iter:
+                        if row and row[0]:  # Only if 'no' is not empty
+                            item = dict(zip(headers, row))
+                            rows.append(item)
+                            sheet_rows.append(item)
+                            tipe = item.get('tipe properti') or item.get('tipe_properti', '')
+                            by_key.setdefault(listing_key(tipe, item.get('no')), item)
+                wb.close()  # Ensure workbook is closed
+            except Exception as e:
+                print(f"Warning: Could not read Excel file: {str(e)}")
+                stamp = None
+        
+        _listing_cache.update(stamp=stamp, rows=rows, by_sheet=by_sheet, by_key=by_key)
+        return _listing_cache
+
+def read_excel_data():
+    """Read all data from all sheets in Excel (served from the in-process cache)"""
+    if STORAGE_BACKEND == 'sqlite':
+        return db_read_rows()
+    return list(get_listing_cache()['rows'])
+
+def get_listing(tipe_properti, no):
+    """Find a single listing by property type and number, or None"""
+    if STORAGE_BACKEND == 'sqlite':
+        init_listing_store()
+        with closing(get_db()) as conn:
+            row = conn.execute(
+                "SELECT data FROM listings WHERE tipe = ? AND no = ? ORDER BY id LIMIT 1",
+                listing_key(tipe_properti, no)
+            ).fetchone()
+        return json.loads(row['data']) if row else None
+    return get_listing_cache()['by_key'].get(listing_key(tipe_properti, no))
+
+# ---------------------------------------------------------------------------
+# Listing table: the index page shows one page of listings, filtered and sorted
+# on the server. The sqlite store filters on indexed columns; the Excel store
+# builds an equivalent in-memory index once per workbook version.
+# ---------------------------------------------------------------------------
+
+LISTING_PAGE_SIZE = int(os.environ.get('LISTING_PAGE_SIZE', '50'))
+LISTING_PAGE_SIZES = (25, 50, 100, 200)
+LISTING_SORTS = {
+    'default': 'Urutan sheet',
+    'newest': 'Terbaru',
+    'harga_asc': 'Harga terendah',
+    'harga_desc': 'Harga tertinggi',
+}
+LISTING_FILTER_FIELDS = ('tipe', 'kategori', 'status', 'area')
+
+def listing_filter_values(item):
+    """(kategori, status, area, harga) of a row, normalized for filtering and sorting"""
+    def text(*keys):
+        for key in keys:
+            value = item.get(key)
+            if value not in (None, ''):
+                return str(value).strip().lower()
+        return ''
+    harga = item.get('harga')
+    if isinstance(harga, str):
+        harga = parse_id_number(harga) if harga.strip() else None
+    elif not isinstance(harga, (int, float)):
+        harga = None
+    return text('kategori'), text('Status', 'status'), text('id area', 'id_area'), harga
+
+def parse_listing_query(args):
+    """Filters, sort and page from the query string (unknown values fall back to defaults)"""
+    def number(key):
+        value = (args.get(key) or '').strip()
+        return parse_id_number(value) if value else None
+    def positive_int(key, default):
+        try:
+            return max(1, int(args.get(key, default)))
+        except (TypeError, ValueError):
+            return default
+    per_page = positive_int('per_page', LISTING_PAGE_SIZE)
+    return {
+        'tipe': normalize_tipe_properti(args.get('tipe', '')) if args.get('tipe') else '',
+        'kategori': (args.get('kategori') or '').strip().lower(),
+        'status': (args.get('status') or '').strip().lower(),
+        'area': (args.get('id_area') or '').strip().lower(),
+        'harga_min': number('harga_min'),
+        'harga_max': number('harga_max'),
+        'sort': args.get('sort') if args.get('sort') in LISTING_SORTS else 'default',
+        'page': positive_int('page', 1),
+        'per_page': per_page if per_page in LISTING_PAGE_SIZES else LISTING_PAGE_SIZE,
+    }
+
+def get_listing_index():
+    """In-memory filter/sort index over the cached workbook rows (Excel store)"""
+    cache = get_listing_cache()
+    with _listing_cache_lock:
+        index = cache.get('index')
+        if index is not None and index['stamp'] == cache['stamp']:
+            return index
+        rows = cache['rows']
+        values = {field: {} for field in LISTING_FILTER_FIELDS}
+        prices = []
+        for pos, item in enumerate(rows):
+            kategori, status, area, harga = listing_filter_values(item)
+            tipe = listing_key(item.get('tipe properti') or item.get('tipe_properti', ''), '')[0]
+            for field, value in zip(LISTING_FILTER_FIELDS, (tipe, kategori, status, area)):
+                values[field].setdefault(value, []).append(pos)
+            if harga is not None:
+                prices.append((harga, pos))
+        prices.sort()
+        priced = [pos for _, pos in prices]
+        unpriced = sorted(set(range(len(rows))) - set(priced))
+        orders = {
+            'default': list(range(len(rows))),
+            'newest': list(range(len(rows) - 1, -1, -1)),
+            # Listings without a price go last in both directions
+            'harga_asc': priced + unpriced,
+            'harga_desc': priced[::-1] + unpriced,
+        }
+        ranks = {}
+        for sort, order in orders.items():
+            rank = [0] * len(rows)
+            for idx, pos in enumerate(order):
+                rank[pos] = idx
+            ranks[sort] = rank
+        index = {'stamp': cache['stamp'], 'rows': rows, 'values': values,
+                 'prices': prices, 'price_keys': [harga for harga, _ in prices],
+                 'orders': orders, 'ranks': ranks}
+        cache['index'] = index
+        return index
+
+def _query_listing_index(query):
+    index = get_listing_index()
+    matches = None
+    for field in LISTING_FILTER_FIELDS:
+        if query[field]:
+            positions = set(index['values'][field].get(query[field], ()))
+            matches = positions if matches is None else matches & positions
+    if query['harga_min'] is not None or query['harga_max'] is not None:
+        lo = 0 if query['harga_min'] is None else bisect.bisect_left(index['price_keys'], query['harga_min'])
+        hi = (len(index['prices']) if query['harga_max'] is None
+              else bisect.bisect_right(index['price_keys'], query['harga_max']))
+        positions = {pos for _, pos in index['prices'][lo:hi]}
+        matches = positions if matches is None else matches & positions
+    offset = (query['page'] - 1) * query['per_page']
+    if matches is None:
+        total = len(index['rows'])
+        page = index['orders'][query['sort']][offset:offset + query['per_page']]
+    else:
+        total = len(matches)
+        page = sorted(matches, key=index['ranks'][query['sort']].__getitem__)[offset:offset + query['per_page']]
+    return [index['rows'][pos] for pos in page], total
+
+def _query_listing_db(query):
+    init_listing_store()
+    where, params = [], []
+    for field in LISTING_FILTER_FIELDS:
+        if query[field]:
+            where.append(f"l.{field} = ?")
+            params.append(query[field])
+    if query['harga_min'] is not None:
+        where.append("l.harga >= ?")
+        params.append(query['harga_min'])
+    if query['harga_max'] is not None:
+        where.append("l.harga <= ?")
+        params.append(query['harga_max'])
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+    order_sql = {
+        'default': "l.sheet_position, l.id",
+        'newest': "l.id DESC",
+        'harga_asc': "l.harga IS NULL, l.harga, l.id",
+        'harga_desc': "l.harga IS NULL, l.harga DESC, l.id DESC",
+    }[query['sort']]
+    with closing(get_db()) as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM listings l {where_sql}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT l.data FROM listings l {where_sql} "
+            f"ORDER BY {order_sql} LIMIT ? OFFSET ?",
+            (*params, query['per_page'], (query['page'] - 1) * query['per_page'])
+        ).fetchall()
+    return [json.loads(row['data']) for row in rows], total
+
+def query_listings(query):
+    """One page of listings for parse_listing_query() filters. Returns (rows, total matches)"""
+    if STORAGE_BACKEND == 'sqlite':
+        return _query_listing_db(query)
+    return _query_listing_index(query)
+
+# ---------------------------------------------------------------------------
+# Full-text search: FTS5 table listing_search in DB_FILE over judul, area,
+# selling point and deskripsi. Text is normalized the same way when indexing
+# and querying (NFKC, "m²"/"meter persegi" -> m2, "1.500.000" -> 1500000,
+# "1,5 M" -> 1500000000, "3KT" -> "3 kt"). The sqlite store updates the index
+# in the write transaction (rowid = listings.id); the Excel store updates it
+# after each save and rebuilds it when the workbook changed behind its back.
+# ---------------------------------------------------------------------------
+
+SEARCH_COLUMNS = (
+    ('judul', ('judul iklan', 'judul_iklan')),
+    ('area', ('id area', 'id_area')),
+    ('selling_point', ('selling point', 'selling_point')),
+    ('deskripsi', ('deskripsi iklan', 'deskripsi_iklan')),
+)
+SEARCH_WEIGHTS = '0, 0, 10.0, 5.0, 2.0, 1.0'  # bm25 weight per column (tipe, no unindexed)
+SEARCH_MAX_RESULTS = 100
+SQUARE_METER_RE = re.compile(r'(?<![a-z0-9])(?:m2|meter\s*persegi|meter2|mtr2)(?![a-z0-9])')
+SEARCH_NUMBER_RE = re.compile(
+    r'(?<![\w.,])(' + NUMBER_PATTERN + r')(?:\s*((?i:miliar|milyar|juta|jt|ribu|rb)|M)(?![\w²]))?'
+)
+DIGIT_LETTER_RE = re.compile(r'(\d)(?=[a-z])')
+
+_search_available = None
+
+def normalize_search_text(text):
+    """Normalize listing text or a query into space-separated search tokens"""
+    text = unicodedata.normalize('NFKC', str(text or ''))  # also turns "m²" into "m2"
+    def number(match):
+        value = parse_id_number(match.group(1))
+        if value is None:
+            return match.group(0)
+        value *= PRICE_MULTIPLIERS.get((match.group(2) or '').lower(), 1)
+        return f' {int(value) if float(value).is_integer() else value} '
+    text = SEARCH_NUMBER_RE.sub(number, text).lower()
+    text = SQUARE_METER_RE.sub(' m2 ', DIGIT_LETTER_RE.sub(r'\1 ', text))
+    return ' '.join(re.findall(r'\w+', text))
+
+def search_index_ready(conn):
+    """True if this SQLite build has FTS5 (the table was created)"""
+    global _search_available
+    if _search_available is None:
+        _search_available = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'listing_search'").fetchone() is not None
+    return _search_available
+
+def search_index_put(conn, item, rowid=None):
+    """(Re)index one listing row; rowid is listings.id in the sqlite store"""
+    if not search_index_ready(conn):
+        return
+    tipe, no = listing_key(item.get('tipe properti') or item.get('tipe_properti', ''), item.get('no'))
+    if rowid is None:
+        conn.execute("INSERT OR IGNORE INTO search_keys (tipe, no) VALUES (?, ?)", (tipe, no))
+        rowid = conn.execute("SELECT id FROM search_keys WHERE tipe = ? AND no = ?", (tipe, no)).fetchone()[0]
+    conn.execute("DELETE FROM listing_search WHERE rowid = ?", (rowid,))
+    values = [normalize_search_text(next((item[k] for k in keys if item.get(k)), ''))
+              for _, keys in SEARCH_COLUMNS]
+    conn.execute(
+        "INSERT INTO listing_search (rowid, tipe, no, judul, area, selling_point, deskripsi) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", (rowid, tipe, no, *values)
+    )
+
+def get_search_source():
+    """What the index must reflect: the sqlite store, or one version of the workbook"""
+    if STORAGE_BACKEND == 'sqlite':
+        return 'sqlite'
+    stamp = get_listing_cache()['stamp']
+    return f'excel:{stamp[0]}:{stamp[1]}' if stamp else 'excel:none'
+
+def ensure_search_index(conn):
+    """Rebuild the index if it does not match the store (first use, backend switch, outside edit)"""
+    source = get_search_source()
+    if get_meta(conn, 'search_source') == source:
+        return
+    conn.execute("DELETE FROM listing_search")
+    conn.execute("DELETE FROM search_keys")
+    if STORAGE_BACKEND == 'sqlite':
+        init_listing_store()
+        for row in conn.execute("SELECT id, data FROM listings").fetchall():
+            search_index_put(conn, json.loads(row['data']), rowid=row['id'])
+    else:
+        for item in get_listing_cache()['rows']:
+            search_index_put(conn, item)
+    set_meta(conn, 'search_source', source)
+
+def sync_search_index(ops, results, old_stamp):
+    """Apply committed workbook ops to the index, if it was current before this save"""
+    try:
+        with closing(get_db()) as conn, conn:
+            if not search_index_ready(conn) or old_stamp is None or \
+                    get_meta(conn, 'search_source') != f'excel:{old_stamp[0]}:{old_stamp[1]}':
+                return  # Out of date anyway: the next search rebuilds it
+            for op, result in zip(ops, results):
+                if isinstance(result, Exception) or not result:
+                    continue
+                if op[0] == 'insert':
+                    search_index_put(conn, {**op[2], 'tipe_properti': op[1]})
+                elif op[0] == 'update':
+                    search_index_put(conn, {**op[3], 'tipe_properti': op[1], 'no': op[2]})
+                elif op[0] in ('delete', 'delete_many'):
+                    nos = op[2] if op[0] == 'delete_many' else [op[2]]
+                    conn.executemany("DELETE FROM listing_search WHERE rowid = "
+                                     "(SELECT id FROM search_keys WHERE tipe = ? AND no = ?)",
+                                     [listing_key(op[1], no) for no in nos])
+            stamp = get_excel_stamp()
+            set_meta(conn, 'search_source', f'excel:{stamp[0]}:{stamp[1]}')
+    except sqlite3.Error as e:
+        print(f"Warning: Could not update search index: {str(e)}")
+
+def build_search_match(query):
+    """FTS5 MATCH expression: every token must match, the last one as a prefix"""
+    tokens = normalize_search_text(query).split()
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+
+def search_listings(query, limit=20):
+    """Listings matching a free-text query, best match first: [(row, score)]"""
+    match = build_search_match(query)
+    if not match:
+        return []
+    with closing(get_db()) as conn:
+        if not search_index_ready(conn):
+            return []
+        with conn:
+            ensure_search_index(conn)
+        hits = conn.execute(
+            f"SELECT rowid, tipe, no, bm25(listing_search, {SEARCH_WEIGHTS}) AS score "
+            "FROM listing_search WHERE listing_search MATCH ? ORDER BY score LIMIT ?",
+            (match, limit)
+        ).fetchall()
+        if STORAGE_BACKEND == 'sqlite':
+            ids = [hit['rowid'] for hit in hits]
+            data = {row['id']: json.loads(row['data']) for row in conn.execute(
+                f"SELECT id, data FROM listings WHERE id IN ({','.join('?' * len(ids))})", ids)}
+            return [(data[hit['rowid']], -hit['score']) for hit in hits if hit['rowid'] in data]
+    by_key = get_listing_cache()['by_key']
+    return [(by_key[(hit['tipe'], hit['no'])], -hit['score']) for hit in hits
+            if (hit['tipe'], hit['no']) in by_key]
+
+def create_header_mapping(tipe_properti):
+    """Create mapping from Excel header (with spaces) to field name (with underscores)"""
+    mapping = {
         'no': 'no',
         'tipe properti': 'tipe_properti',
         'kategori': 'kategori',
@@ -632,34 +2518,11 @@ def create_header_mapping(tipe_properti):
     }
     return mapping
 
-def save_to_excel(data, tipe_properti=None):
-    """Save data to Excel in the appropriate sheet based on property type"""
-    init_excel()
-    
-    # Determine sheet name
-    sheet_name = get_sheet_name(tipe_properti) if tipe_properti else "Data Properti"
-    
-    wb = load_workbook(EXCEL_FILE)
-    
-    # Create sheet if it doesn't exist
-    if sheet_name not in wb.sheetnames:
-        ws = wb.create_sheet(sheet_name)
-        columns = get_excel_columns(tipe_properti)
-        for idx, col in enumerate(columns, 1):
-            ws.cell(row=1, column=idx, value=col)
-    else:
-        ws = wb[sheet_name]
-    
-    # Get columns from sheet header
-    headers = []
-    for cell in ws[1]:
-        if cell.value:
-            headers.append(cell.value)
-    
+def build_row_values(headers, data, tipe_properti=None):
+    """Build row values in header order from form data (header names or field names)"""
     # Create mapping for converting field names
     header_mapping = create_header_mapping(tipe_properti)
     
-    # Build row data based on headers
     row_data = []
     for header in headers:
         # Try to get value using header name first (with spaces)
@@ -669,90 +2532,1343 @@ def save_to_excel(data, tipe_properti=None):
             field_name = header_mapping.get(header, header.lower().replace(' ', '_'))
             value = data.get(field_name, '')
         row_data.append(value)
+    return row_data
+
+# ---------------------------------------------------------------------------
+# Write path. Every mutation is an op tuple:
+#   ('insert', tipe_properti, data)
+#   ('update', tipe_properti, no, data)
+#   ('delete', sheet_name, no)
+#   ('delete_many', sheet_name, [no, ...])
+#   ('patch_many', sheet_name, [no, ...], {field: value})
+# Concurrent ops are grouped (group commit) and applied in a single streaming
+# pass over the workbook, or a single transaction in the SQLite store.
+# ---------------------------------------------------------------------------
+
+# How long the first writer waits for others to join its batch (0 disables batching)
+GROUP_COMMIT_WINDOW = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', '20')) / 1000
+# How long a queued writer waits for its batch before giving up with an error
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT_SECONDS', '120'))
+
+# Fields that can be changed in bulk, with their allowed values (None: free text)
+PATCHABLE_FIELDS = {
+    'status': ('Tayang', 'Tunda', ''),
+    'aktivasi_premier': ('Yes', 'No', ''),
+    'aktivasi_featured': ('Yes', 'No', ''),
+    'jadwal_sundul': ('1 time daily', '2 times daily', '3 times daily', ''),
+    'durasi_sundul': None,
+}
+
+def _header_columns(headers, fields):
+    """{field: column number} for the fields that exist in a sheet"""
+    header_mapping = create_header_mapping(None)
+    columns = {}
+    for idx, header in enumerate(headers, 1):
+        field = header_mapping.get(header, header.lower().replace(' ', '_'))
+        if field in fields:
+            columns.setdefault(field, idx)
+    return columns
+
+def _sheet_headers(first_row):
+    """Header names from a sheet's first row (empty cells skipped)"""
+    return [value for value in first_row if value]
+
+def _row_no(values):
+    # The first column is 'no'
+    return str(values[0]).strip() if values and values[0] else None
+
+def _plan_workbook_ops(ops, sheet_headers):
+    """Turn a batch of ops into per-sheet row ops for one streaming pass over the workbook.
+
+    sheet_headers maps the existing sheets to their headers; sheets created by an
+    insert are added to it. Returns ({sheet_name: [(op index, kind, args)]}, results):
+    inserts, failures and ops on missing sheets are settled here, the other
+    counts grow while the rows stream by.
+    """
+    plan = {}
+    results = []
+    for idx, op in enumerate(ops):
+        results.append(0)
+        try:
+            if op[0] == 'insert':
+                tipe_properti, data = op[1:]
+                sheet_name = get_sheet_name(tipe_properti) if tipe_properti else "Data Properti"
+                if sheet_name not in sheet_headers:
+                    sheet_headers[sheet_name] = get_excel_columns(tipe_properti)
+                row_op = ('insert', build_row_values(sheet_headers[sheet_name], data, tipe_properti))
+                results[idx] = 1
+            elif op[0] == 'update':
+                tipe_properti, no, data = op[1:]
+                sheet_name = get_sheet_name(tipe_properti)
+                if sheet_name not in sheet_headers:
+                    continue
+                row_op = ('update', (str(no).strip(), build_row_values(sheet_headers[sheet_name], data, tipe_properti)))
+            elif op[0] in ('delete', 'delete_many'):
+                sheet_name, nos = op[1], op[2] if op[0] == 'delete_many' else [op[2]]
+                if sheet_name not in sheet_headers:
+                    continue
+                row_op = ('delete', {str(no).strip() for no in nos})
+            elif op[0] == 'patch_many':
+                sheet_name, nos, changes = op[1:]
+                if sheet_name not in sheet_headers:
+                    continue
+                columns = _header_columns(sheet_headers[sheet_name], changes)
+                row_op = ('patch', ({str(no).strip() for no in nos},
+                                    {col_idx - 1: changes[field] for field, col_idx in columns.items()}))
+            else:
+                raise ValueError(f"Unknown write op: {op[0]}")
+        except Exception as e:
+            results[idx] = e
+            continue
+        plan.setdefault(sheet_name, []).append((idx, *row_op))
+    return plan, results
+
+def _apply_row_ops(values, row_ops, results):
+    """Pass one row through a sheet's row ops in batch order; returns it, or None once deleted"""
+    for idx, kind, args in row_ops:
+        if kind == 'insert':
+            continue
+        no = _row_no(values)
+        if kind == 'update':
+            # Only the first row with that number, like a lookup at the time of the op
+            if no == args[0] and not results[idx]:
+                values[:len(args[1])] = args[1]
+                results[idx] = 1
+        elif kind == 'delete':
+            if no in args:
+                results[idx] += 1
+                return None
+        elif no in args[0]:
+            for col_idx, value in args[1].items():
+                values.extend([None] * (col_idx + 1 - len(values)))
+                values[col_idx] = value
+            results[idx] += 1
+    return values
+
+def _rewritten_rows(rows, row_ops, results):
+    """Data rows of one sheet after the batch: the existing rows, then the inserted ones.
+    An inserted row only sees the ops that come after its insert."""
+    if not row_ops:
+        yield from rows
+        return
+    for row in rows:
+        values = _apply_row_ops(list(row), row_ops, results)
+        if values is not None:
+            yield values
+    for pos, (idx, kind, args) in enumerate(row_ops):
+        if kind == 'insert':
+            values = _apply_row_ops(list(args), row_ops[pos + 1:], results)
+            if values is not None:
+                yield values
+
+def rewrite_workbook(ops):
+    """Apply a batch of ops in one streaming pass: the workbook is read in read-only
+    mode, every row goes through the ops and is written out in write-only mode,
+    so memory stays flat. Returns one result per op, like commit_writes."""
+    with timed_phase('workbook_load'):
+        wb = load_workbook(EXCEL_FILE, read_only=True)
+    try:
+        first_rows = {ws.title: list(next(ws.iter_rows(max_row=1, values_only=True), ())) for ws in wb.worksheets}
+        sheet_headers = {sheet_name: _sheet_headers(row) for sheet_name, row in first_rows.items()}
+        plan, results = _plan_workbook_ops(ops, sheet_headers)
+        if not plan:
+            return results
+        sheets = [(ws.title, first_rows[ws.title],
+                   _rewritten_rows(ws.iter_rows(min_row=2, values_only=True), plan.get(ws.title), results))
+                  for ws in wb.worksheets]
+        # Sheets created by inserts go last, in the order they were created
+        sheets += [(sheet_name, headers, _rewritten_rows((), plan[sheet_name], results))
+                   for sheet_name, headers in sheet_headers.items() if sheet_name not in first_rows]
+        with timed_phase('workbook_save'):
+            write_workbook_streaming(sheets, keep=lambda: any(
+                not isinstance(r, Exception) and r for r in results
+            ))
+    finally:
+        wb.close()
+    return results
+
+def _db_insert(conn, tipe_properti, data):
+    sheet_name = get_sheet_name(tipe_properti) if tipe_properti else "Data Properti"
+    headers = db_ensure_sheet(conn, sheet_name, tipe_properti)
+    db_insert_row(conn, sheet_name, headers, build_row_values(headers, data, tipe_properti))
+    return 1
+
+def _db_update(conn, tipe_properti, no, updated_data):
+    sheet_name = get_sheet_name(tipe_properti)
+    sheet = conn.execute("SELECT headers FROM sheets WHERE name = ?", (sheet_name,)).fetchone()
+    row = conn.execute(
+        "SELECT id FROM listings WHERE sheet = ? AND no = ? ORDER BY id LIMIT 1",
+        (sheet_name, str(no).strip())
+    ).fetchone()
+    if not sheet or not row:
+        return 0
+    headers = json.loads(sheet['headers'])
+    item = dict(zip(headers, build_row_values(headers, updated_data, tipe_properti)))
+    tipe = item.get('tipe properti') or item.get('tipe_properti', '')
+    conn.execute(
+        "UPDATE listings SET tipe = ?, no = ?, data = ?, kategori = ?, status = ?, area = ?, harga = ? "
+        "WHERE id = ?",
+        (*listing_key(tipe, item.get('no')), json.dumps(item, default=str),
+         *listing_filter_values(item), row['id'])
+    )
+    search_index_put(conn, item, rowid=row['id'])
+    return 1
+
+def _db_patch_many(conn, sheet_name, nos, changes):
+    sheet = conn.execute("SELECT headers FROM sheets WHERE name = ?", (sheet_name,)).fetchone()
+    if not sheet:
+        return 0
+    headers = json.loads(sheet['headers'])
+    updates = {headers[idx - 1]: changes[field] for field, idx in _header_columns(headers, changes).items()}
+    nos = list(dict.fromkeys(str(no).strip() for no in nos))
+    params = []
+    for start in range(0, len(nos), 500):  # stay below SQLite's parameter limit
+        chunk = nos[start:start + 500]
+        for row in conn.execute(
+            f"SELECT id, data FROM listings WHERE sheet = ? AND no IN ({','.join('?' * len(chunk))})",
+            (sheet_name, *chunk)
+        ).fetchall():
+            item = {**json.loads(row['data']), **updates}
+            params.append((json.dumps(item, default=str), *listing_filter_values(item), row['id']))
+    conn.executemany("UPDATE listings SET data = ?, kategori = ?, status = ?, area = ?, harga = ? WHERE id = ?",
+                     params)
+    return len(params)
+
+def _db_delete(conn, sheet_name, no):
+    return _db_delete_many(conn, sheet_name, [no])
+
+def _db_delete_many(conn, sheet_name, nos):
+    nos = [str(no).strip() for no in nos]
+    removed = 0
+    for start in range(0, len(nos), 500):  # stay below SQLite's parameter limit
+        chunk = nos[start:start + 500]
+        where = f"sheet = ? AND no IN ({','.join('?' * len(chunk))})"
+        if search_index_ready(conn):
+            conn.execute(f"DELETE FROM listing_search WHERE rowid IN (SELECT id FROM listings WHERE {where})",
+                         (sheet_name, *chunk))
+        removed += conn.execute(f"DELETE FROM listings WHERE {where}", (sheet_name, *chunk)).rowcount
+    return removed
+
+DB_OPS = {'insert': _db_insert, 'update': _db_update, 'delete': _db_delete,
+          'delete_many': _db_delete_many, 'patch_many': _db_patch_many}
+
+@with_write_lock
+def commit_writes(ops):
+    """Apply a batch of ops in one streaming workbook pass (or one transaction).
+
+    Returns one entry per op: the number of affected rows, or the exception
+    raised while applying that op. If the save itself fails, it raises.
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        results = []
+        init_listing_store()
+        conn = get_db()
+        conn.isolation_level = None  # manage the transaction explicitly
+        try:
+            with timed_phase('db_commit'):
+                conn.execute("BEGIN IMMEDIATE")
+                for op in ops:
+                    # A failing op only rolls back its own savepoint
+                    conn.execute("SAVEPOINT op")
+                    try:
+                        results.append(DB_OPS[op[0]](conn, *op[1:]))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO op")
+                        results.append(e)
+                    conn.execute("RELEASE op")
+                bump_data_version(conn)
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return results
+    
+    init_excel()
+    old_stamp = get_excel_stamp()
+    try:
+        results = rewrite_workbook(ops)
+        if any(not isinstance(r, Exception) and r for r in results):
+            with timed_phase('search_index'):
+                sync_search_index(ops, results, old_stamp)
+    finally:
+        invalidate_listing_cache()
+    return results
+
+class _PendingWrite:
+    def __init__(self, op):
+        self.op = op
+        self.ready = threading.Event()  # set when the result is in, or when promoted to leader
+        self.lead = False
+        self.finished = False
+        self.result = None
+
+_pending_writes = []
+_pending_writes_lock = threading.Lock()
+_commit_leader_active = False
+
+def _commit_pending_batch():
+    """Leader: commit every queued write in one batch, then hand the leader role
+    to a writer that queued meanwhile. Every writer in the batch gets a result,
+    the exception if the batch failed as a whole."""
+    global _commit_leader_active
+    batch, results = [], []
+    try:
+        with _pending_writes_lock:
+            burst = len(_pending_writes) > 1
+        if burst:
+            time.sleep(GROUP_COMMIT_WINDOW)
+        with write_lock():
+            # Taken only once the lock is held: writers that queued while another thread
+            # or another gunicorn worker was committing all join this batch
+            with _pending_writes_lock:
+                batch = _pending_writes[:]
+                _pending_writes.clear()
+            results = commit_writes([p.op for p in batch])
+    except Exception as e:
+        if not batch:
+            with _pending_writes_lock:
+                batch = _pending_writes[:]
+                _pending_writes.clear()
+        results = [e] * len(batch)
+    finally:
+        with _pending_writes_lock:
+            if _pending_writes:
+                successor = _pending_writes[0]
+                successor.lead = True
+                successor.ready.set()
+            else:
+                _commit_leader_active = False
+        for p, r in zip(batch, results):
+            p.result = r
+            p.finished = True
+            p.ready.set()
+
+def submit_write(op):
+    """Queue a mutation and block until it is durably written.
+
+    Writes queue up while a batch is being committed, by this process or
+    (through the file lock) by another worker; the next leader commits them
+    all with one commit_writes(). A lone writer commits right away: the leader
+    only waits GROUP_COMMIT_WINDOW for more writers when others are already
+    queued. Waiting is bounded by GROUP_COMMIT_TIMEOUT.
+    """
+    global _commit_leader_active
+    if GROUP_COMMIT_WINDOW <= 0:
+        result = commit_writes([op])[0]
+    else:
+        pending = _PendingWrite(op)
+        with _pending_writes_lock:
+            _pending_writes.append(pending)
+            pending.lead = not _commit_leader_active
+            _commit_leader_active = True
+        
+        if not pending.lead and not pending.ready.wait(GROUP_COMMIT_TIMEOUT):
+            with _pending_writes_lock:
+                if not pending.lead and pending in _pending_writes:
+                    # Never picked up: withdraw it, nothing was written
+                    _pending_writes.remove(pending)
+                    raise TimeoutError("Penyimpanan data sedang sibuk, silakan coba lagi sebentar lagi.")
+            # Already part of a batch that is being committed
+            if not pending.ready.wait(GROUP_COMMIT_TIMEOUT):
+                raise TimeoutError("Penyimpanan data belum selesai; periksa kembali apakah data sudah tersimpan.")
+        if pending.lead and not pending.finished:
+            _commit_pending_batch()
+        result = pending.result
     
-    ws.append(row_data)
-    wb.save(EXCEL_FILE)
-    wb.close()  # Ensure file is properly closed
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def save_to_excel(data, tipe_properti=None):
+    """Save data to Excel in the appropriate sheet based on property type"""
+    submit_write(('insert', tipe_properti, data))
 
 def update_excel_row(tipe_properti, no, updated_data):
     """Update an existing row in Excel"""
-    init_excel()
-    sheet_name = get_sheet_name(tipe_properti)
+    return submit_write(('update', tipe_properti, no, updated_data))
+
+def delete_excel_rows(sheet_name, no):
+    """Delete every row with the given 'no' from a sheet; returns the number of rows removed"""
+    return submit_write(('delete', sheet_name, no))
+
+def delete_listings(pairs):
+    """Delete many (tipe_properti, no) listings: one write batch with one op per sheet,
+    one pass over their image folders and a single archive update. Returns rows removed."""
+    by_sheet = {}
+    for tipe_properti, no in pairs:
+        by_sheet.setdefault(get_sheet_name(tipe_properti), []).append(str(no).strip())
+    results = commit_writes([('delete_many', sheet_name, nos) for sheet_name, nos in by_sheet.items()])
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    remove_listing_files(pairs)
+    refresh_archive()
+    return sum(results)
+
+def patch_listings(pairs, changes):
+    """Apply the same {field: value} changes to many listings in one write batch
+    (one op per sheet) and update the archive once. Returns rows changed."""
+    by_sheet = {}
+    for tipe_properti, no in pairs:
+        by_sheet.setdefault(get_sheet_name(tipe_properti), []).append(str(no).strip())
+    results = commit_writes([('patch_many', sheet_name, nos, changes) for sheet_name, nos in by_sheet.items()])
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    if any(results):
+        refresh_archive()
+    return sum(results)
+
+def remove_listing_files(pairs):
+    """Remove the image folders and thumbnails of deleted listings, then queue blob GC"""
+    for tipe_properti, no in pairs:
+        property_folder = os.path.join(UPLOAD_FOLDER, tipe_properti, str(no))
+        if os.path.exists(property_folder):
+            try:
+                shutil.rmtree(property_folder)
+            except Exception as e:
+                print(f"Warning: Could not delete property folder: {str(e)}")
+        remove_thumbnails(tipe_properti, no)
+    enqueue_job('blob-gc', unique=True)
+
+def iter_archive_sources():
+    """Yield (file_path, arcname) for every image that belongs in the ZIP, in stable order"""
+    for root, dirs, files in os.walk(UPLOAD_FOLDER):
+        # Hidden folders (.thumbs, .blobs) are not part of the export
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for file in sorted(files):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                file_path = os.path.join(root, file)
+                # Get relative path from UPLOAD_FOLDER
+                rel_path = os.path.relpath(file_path, UPLOAD_FOLDER)
+                # Don't include 'images' folder in the archive path
+                # Example: uploads/rumah/1/cover.jpg -> rumah/1/cover.jpg
+                parts = rel_path.split(os.sep)
+                # Filter out 'images' directory
+                filtered_parts = [p for p in parts if p != 'images']
+                yield file_path, '/'.join(filtered_parts)
+
+def load_archive_manifest():
+    """Load the archive manifest, or an empty one if missing/corrupt"""
+    try:
+        with open(ARCHIVE_MANIFEST) as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict) and isinstance(manifest.get('entries'), list):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {}
+
+def save_archive_manifest(manifest):
+    """Write the archive manifest atomically"""
+    tmp_file = ARCHIVE_MANIFEST + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, ARCHIVE_MANIFEST)
+
+def collect_archive_entries():
+    """List everything the ZIP should contain: images first, Excel file last"""
+    entries = []
+    sources = list(iter_archive_sources())
+    if os.path.exists(EXCEL_FILE):
+        sources.append((EXCEL_FILE, EXCEL_ARCNAME))
+    for file_path, arcname in sources:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        entries.append({'arcname': arcname, 'path': file_path,
+                        'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+    return entries
+
+# Stored ZIP entries are written by hand (local header, data, central directory),
+# so the archive can be updated by appending: entries that changed or disappeared
+# are only left out of the central directory, and new ones are appended after the data.
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+ZIP_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+ZIP_END_RECORD = struct.Struct('<4s4H2LH')
+ZIP64_END_RECORD = struct.Struct('<4sQ2H2L4Q')
+ZIP64_END_LOCATOR = struct.Struct('<4sLQL')
+ZIP_LIMIT = 0xFFFFFFFF
+# Rebuild the archive from scratch once dead space (dropped entries) passes this share of the file
+ARCHIVE_COMPACT_RATIO = float(os.environ.get('ARCHIVE_COMPACT_RATIO', '0.5'))
+
+def zip_dos_datetime(mtime_ns):
+    """(DOS time, DOS date) of a modification time, clamped to 1980 like zipfile does"""
+    t = time.localtime(mtime_ns / 1e9)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+def write_zip_entry(f, entry):
+    """Write one stored entry at the current position and return its manifest record"""
+    if entry['size'] >= ZIP_LIMIT:
+        raise ValueError('file too large for a stored ZIP entry')
+    name = entry['arcname'].encode('utf-8')
+    flags = 0 if entry['arcname'].isascii() else 0x800  # UTF-8 file name
+    dos_time, dos_date = zip_dos_datetime(entry['mtime_ns'])
+    offset = f.tell()
+    f.write(ZIP_LOCAL_HEADER.pack(b'PK\x03\x04', 20, flags, 0, dos_time, dos_date, 0, 0, 0, len(name), 0))
+    f.write(name)
+    crc = data_size = 0
+    with open(entry['path'], 'rb') as src:
+        while True:
+            chunk = src.read(ZIP_STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            data_size += len(chunk)
+            f.write(chunk)
+    if data_size >= ZIP_LIMIT:
+        raise ValueError('file too large for a stored ZIP entry')
+    end = f.tell()
+    # CRC and sizes are only known after copying: patch them into the local header
+    f.seek(offset + 14)
+    f.write(struct.pack('<3L', crc, data_size, data_size))
+    f.seek(end)
+    return {'arcname': entry['arcname'], 'size': entry['size'], 'mtime_ns': entry['mtime_ns'],
+            'offset': offset, 'length': end - offset, 'crc': crc, 'data_size': data_size,
+            'dos': [dos_time, dos_date]}
+
+def append_zip_entries(f, entries):
+    """Write stored entries one after another from the current position; returns their records"""
+    written = []
+    for entry in entries:
+        offset = f.tell()
+        try:
+            written.append(write_zip_entry(f, entry))
+        except (OSError, ValueError) as e:
+            f.seek(offset)  # the next entry overwrites the partial one
+            print(f"Warning: Could not add {entry['path']} to ZIP: {str(e)}")
+    return written
+
+def write_zip_directory(f, records):
+    """Write the central directory for records at the current position and end the file there.
+    ZIP64 records are added once offsets or the entry count outgrow the classic format."""
+    start = f.tell()
+    for record in records:
+        name = record['arcname'].encode('utf-8')
+        flags = 0 if record['arcname'].isascii() else 0x800
+        offset, extra, version = record['offset'], b'', 20
+        if offset >= ZIP_LIMIT:
+            offset, extra, version = ZIP_LIMIT, struct.pack('<2HQ', 1, 8, record['offset']), 45
+        dos_time, dos_date = record['dos']
+        f.write(ZIP_CENTRAL_HEADER.pack(
+            b'PK\x01\x02', (3 << 8) | version, version, flags, 0, dos_time, dos_date,
+            record['crc'], record['data_size'], record['data_size'], len(name), len(extra), 0, 0, 0,
+            0o100644 << 16, offset
+        ))
+        f.write(name)
+        f.write(extra)
+    end = f.tell()
+    count, size = len(records), end - start
+    if count >= 0xFFFF or start >= ZIP_LIMIT or size >= ZIP_LIMIT:
+        f.write(ZIP64_END_RECORD.pack(b'PK\x06\x06', 44, 45, 45, 0, 0, count, count, size, start))
+        f.write(ZIP64_END_LOCATOR.pack(b'PK\x06\x07', 0, end, 1))
+        count, size, start = min(count, 0xFFFF), min(size, ZIP_LIMIT), min(start, ZIP_LIMIT)
+    f.write(ZIP_END_RECORD.pack(b'PK\x05\x06', 0, 0, count, count, size, start, 0))
+    f.truncate()
+
+@with_write_lock
+@timed_phase('zip')
+def create_zip():
+    """Update ZIP with structure: {tipe_properti}/{no}/ dengan Excel file, incrementally.
+
+    The manifest records every entry with its offset. Changed or removed entries
+    are only dropped from the central directory, their bytes stay behind as dead
+    space; new and changed files are appended after the last entry and the
+    central directory is written again behind them. Once the dead space passes
+    ARCHIVE_COMPACT_RATIO of the file, the archive is rewritten compactly.
+    The live file is never modified: every update is written to a copy that is
+    swapped in with os.replace, so a download in progress keeps a whole archive.
+    Images and the workbook are already compressed, so they are stored without deflate.
+    """
+    ensure_excel_export()
+    wanted = collect_archive_entries()
+    wanted_stat = {e['arcname']: (e['size'], e['mtime_ns']) for e in wanted}
     
-    wb = load_workbook(EXCEL_FILE)
-    if sheet_name not in wb.sheetnames:
-        wb.close()
+    manifest = load_archive_manifest()
+    archive = manifest.get('archive')
+    zip_file = os.path.join(UPLOAD_FOLDER, archive) if archive else get_zip_filename()
+    try:
+        # A manifest from an older layout, or a file changed behind its back, means a full rebuild
+        in_sync = bool(archive) and 'data_end' in manifest and os.path.getsize(zip_file) == manifest.get('zip_size')
+    except OSError:
+        in_sync = False
+    old_entries = manifest['entries'] if in_sync else []
+    
+    kept = [e for e in old_entries if wanted_stat.get(e['arcname']) == (e['size'], e['mtime_ns'])]
+    kept_names = {e['arcname'] for e in kept}
+    to_write = [e for e in wanted if e['arcname'] not in kept_names]
+    if in_sync and not to_write and len(kept) == len(old_entries):
+        return  # Nothing changed
+    dead_bytes = manifest.get('dead_bytes', 0) + sum(
+        e['length'] for e in old_entries if e['arcname'] not in kept_names
+    )
+    
+    # Named after the current timestamp so the download name reflects the last update
+    new_zip_file = get_zip_filename()
+    tmp_file = new_zip_file + '.tmp'
+    try:
+        if in_sync and dead_bytes <= ARCHIVE_COMPACT_RATIO * manifest['zip_size']:
+            # Copy the live archive and append to the copy (the old central directory is overwritten)
+            shutil.copyfile(zip_file, tmp_file)
+            with open(tmp_file, 'r+b') as f:
+                f.seek(manifest['data_end'])
+                records = kept + append_zip_entries(f, to_write)
+                data_end = f.tell()
+                write_zip_directory(f, records)
+                zip_size = f.tell()
+        else:
+            # First build, out of sync or too much dead space: write a compact archive
+            with open(tmp_file, 'wb') as f:
+                records = append_zip_entries(f, wanted)
+                data_end = f.tell()
+                write_zip_directory(f, records)
+                zip_size = f.tell()
+            dead_bytes = 0
+        os.replace(tmp_file, new_zip_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    
+    save_archive_manifest({'archive': os.path.basename(new_zip_file), 'entries': records,
+                           'data_end': data_end, 'zip_size': zip_size, 'dead_bytes': dead_bytes})
+    # Only now that the manifest points at the new file; open downloads keep reading the old one
+    if new_zip_file != zip_file and os.path.exists(zip_file):
+        os.remove(zip_file)
+
+@with_write_lock
+def mark_archive_dirty():
+    """Mark the stored ZIP as outdated (lazy/background mode)"""
+    with open(ARCHIVE_DIRTY_FLAG, 'w') as f:
+        f.write(datetime.now().isoformat())
+
+def is_archive_dirty():
+    return os.path.exists(ARCHIVE_DIRTY_FLAG)
+
+def refresh_archive():
+    """Bring the ZIP export up to date after a write, according to ARCHIVE_MODE"""
+    if ARCHIVE_MODE == 'lazy':
+        mark_archive_dirty()
+    elif ARCHIVE_MODE == 'background':
+        mark_archive_dirty()
+        enqueue_job('archive', unique=True)
+    else:
+        create_zip()
+
+# ---------------------------------------------------------------------------
+# Background jobs: table jobs in DB_FILE, no external broker. Jobs are claimed
+# with one atomic UPDATE, so worker threads of every gunicorn process can share
+# the queue; a job left 'running' by a crashed or restarted process is picked
+# up again once its lease expires. Handlers register with @job_handler(kind).
+# ---------------------------------------------------------------------------
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL_SECONDS', '1'))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '600'))
+JOB_MAX_ATTEMPTS = 3
+JOB_HISTORY_SECONDS = 24 * 3600
+
+JOB_HANDLERS = {}
+_job_wakeup = threading.Event()
+_job_workers_started = False
+_job_workers_lock = threading.Lock()
+
+def job_handler(kind):
+    """Decorator: register func(payload) as the handler for jobs of this kind"""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue_job(kind, payload=None, unique=False):
+    """Queue a job; with unique=True nothing is added while the same kind is already waiting"""
+    now = time.time()
+    with closing(get_db()) as conn, conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO jobs (kind, payload, status, dedupe_key, created_at, run_after) "
+            "VALUES (?, ?, 'queued', ?, ?, ?)",
+            (kind, json.dumps(payload or {}), kind if unique else None, now, now)
+        )
+        conn.execute("DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (now - JOB_HISTORY_SECONDS,))
+    start_job_workers()
+    _job_wakeup.set()
+
+def claim_job():
+    """Atomically take the oldest runnable job (or one whose lease expired), or None"""
+    now = time.time()
+    with closing(get_db()) as conn, conn:
+        return conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+            "started_at = ?, lease_until = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+            "OR (status = 'running' AND lease_until < ?) ORDER BY id LIMIT 1) "
+            "RETURNING id, kind, payload, attempts",
+            (now, now + JOB_LEASE_SECONDS, now, now)
+        ).fetchone()
+
+def run_job(job):
+    handler = JOB_HANDLERS.get(job['kind'])
+    try:
+        if handler is None:
+            raise Exception(f"Tidak ada handler untuk job {job['kind']}")
+        handler(json.loads(job['payload']))
+    except Exception as e:
+        print(f"Warning: Job {job['id']} ({job['kind']}) failed: {str(e)}")
+        with closing(get_db()) as conn, conn:
+            # A unique job keeps its dedupe_key, so the retry is not duplicated by later
+            # enqueues; if one of them is already waiting, that one does the retry
+            requeued = job['attempts'] < JOB_MAX_ATTEMPTS and conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, run_after = ? WHERE id = ? AND NOT EXISTS "
+                "(SELECT 1 FROM jobs AS other WHERE other.dedupe_key = jobs.dedupe_key AND other.status = 'queued')",
+                (str(e), time.time() + 2 ** job['attempts'], job['id'])
+            ).rowcount
+            if not requeued:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                             (str(e), time.time(), job['id']))
         return
+    with closing(get_db()) as conn, conn:
+        conn.execute("UPDATE jobs SET status = 'done', error = NULL, finished_at = ? WHERE id = ?",
+                     (time.time(), job['id']))
+
+def job_worker_loop():
+    while True:
+        try:
+            job = claim_job()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not claim job: {str(e)}")
+            job = None
+        if job is None:
+            _job_wakeup.wait(JOB_POLL_INTERVAL)
+            _job_wakeup.clear()
+            continue
+        run_job(job)
+
+@app.before_request
+def start_job_workers():
+    """Start the worker threads of this process once (also picks up jobs left from before a restart)"""
+    global _job_workers_started
+    if _job_workers_started or JOB_WORKERS <= 0:
+        return
+    with _job_workers_lock:
+        if _job_workers_started:
+            return
+        for idx in range(JOB_WORKERS):
+            threading.Thread(target=job_worker_loop, name=f'job-worker-{idx}', daemon=True).start()
+        _job_workers_started = True
+
+def clear_pending_jobs():
+    """Drop queued jobs (used by reset-all: they refer to data that is gone)"""
+    with closing(get_db()) as conn, conn:
+        conn.execute("DELETE FROM jobs WHERE status = 'queued'")
+
+def get_archive_state():
+    """'up_to_date', 'rebuilding' (job queued/running), 'stale' (built on download) or 'failed'"""
+    if not is_archive_dirty():
+        return 'up_to_date'
+    if ARCHIVE_MODE != 'background':
+        return 'stale'
+    with closing(get_db()) as conn:
+        last = conn.execute("SELECT status FROM jobs WHERE kind = 'archive' ORDER BY id DESC LIMIT 1").fetchone()
+    if last and last['status'] == 'failed':
+        return 'failed'
+    return 'rebuilding'
+
+@job_handler('archive')
+def run_archive_job(payload):
+    # Writers mark the archive dirty under the same lock, so clearing the flag here
+    # can never hide a write the rebuild did not include
+    with write_lock():
+        create_zip()
+        if os.path.exists(ARCHIVE_DIRTY_FLAG):
+            os.remove(ARCHIVE_DIRTY_FLAG)
+
+@app.cli.command('run-jobs')
+def run_jobs_command():
+    """Run background jobs in the foreground (for a dedicated worker process, e.g. with JOB_WORKERS=0 in the web workers)."""
+    click.echo(f'Menjalankan job worker (poll {JOB_POLL_INTERVAL}s)...')
+    job_worker_loop()
+
+class _ZipStream:
+    """Write-only sink for zipfile that hands out what was written so far"""
+    def __init__(self):
+        self._chunks = []
     
-    ws = wb[sheet_name]
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
     
-    # Get headers
-    headers = []
-    for cell in ws[1]:
-        if cell.value:
-            headers.append(cell.value)
+    def flush(self):
+        pass
     
-    # Find and update row
-    for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=False), start=2):
-        if row[0].value and str(row[0].value) == str(no):
-            # Create mapping for converting field names
-            header_mapping = create_header_mapping(tipe_properti)
-            
-            # Update each cell in the row
-            for col_idx, header in enumerate(headers, 1):
-                # Try to get value using header name first (with spaces)
-                value = updated_data.get(header, '')
-                # If not found, try mapping to underscore version
-                if not value:
-                    field_name = header_mapping.get(header, header.lower().replace(' ', '_'))
-                    value = updated_data.get(field_name, '')
-                
-                ws.cell(row=row_idx, column=col_idx, value=value)
-            break
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def generate_zip_stream():
+    """Yield a ZIP of all images plus the Excel file, chunk by chunk, without a temp file"""
+    stream = _ZipStream()
+    sources = list(iter_archive_sources())
+    if os.path.exists(EXCEL_FILE):
+        sources.append((EXCEL_FILE, EXCEL_ARCNAME))
     
-    wb.save(EXCEL_FILE)
-    wb.close()
+    with zipfile.ZipFile(stream, 'w') as zipf:
+        for file_path, arcname in sources:
+            try:
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = zipfile.ZIP_STORED
+                with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                    while True:
+                        chunk = src.read(ZIP_STREAM_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        yield stream.drain()
+            except OSError as e:
+                print(f"Warning: Could not add {file_path} to ZIP stream: {str(e)}")
+            yield stream.drain()
+    yield stream.drain()
 
-def create_zip():
-    """Create ZIP with structure: {tipe_properti}/{no}/ dengan Excel file"""
-    zip_file = get_zip_filename()
+# ---------------------------------------------------------------------------
+# Image pipeline: uploads are capped to IMAGE_MAX_DIMENSION, stripped of EXIF
+# (after applying its rotation) and re-encoded at IMAGE_QUALITY in a process
+# pool, keeping their cover.{ext} / foto{n}.{ext} names. A THUMB_SIZE JPEG
+# thumbnail goes to uploads/.thumbs/ (not part of the ZIP).
+# ---------------------------------------------------------------------------
+
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '1920'))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '82'))
+THUMB_SIZE = int(os.environ.get('THUMB_SIZE', '320'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', str(os.cpu_count() or 1)))
+THUMB_FOLDER = os.path.join(UPLOAD_FOLDER, '.thumbs')
+
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+def get_thumb_path(image_path):
+    """uploads/{tipe}/{no}/cover.png -> uploads/.thumbs/{tipe}/{no}/cover.jpg"""
+    rel_path = os.path.relpath(image_path, UPLOAD_FOLDER)
+    return os.path.join(THUMB_FOLDER, os.path.splitext(rel_path)[0] + '.jpg')
+
+def get_staged_path(dest_path):
+    """Where an upload waits for processing: hidden and without an image extension, so never archived"""
+    folder, filename = os.path.split(dest_path)
+    return os.path.join(folder, f'.{filename}.upload')
+
+def save_thumbnail(img, thumb_path, thumb_size):
+    thumb = img.copy()
+    thumb.thumbnail((thumb_size, thumb_size), Image.LANCZOS)
+    if thumb.mode in ('RGBA', 'LA', 'P'):
+        thumb = thumb.convert('RGBA')
+        background = Image.new('RGB', thumb.size, 'white')
+        background.paste(thumb, mask=thumb.getchannel('A'))
+        thumb = background
+    elif thumb.mode != 'RGB':
+        thumb = thumb.convert('RGB')
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    thumb.save(thumb_path, 'JPEG', quality=75, optimize=True)
+
+def process_image(staged_path, dest_path, thumb_path, max_dimension, quality, thumb_size):
+    """Re-encode a staged upload into dest_path (format from its extension) and write its thumbnail.
+
+    Runs in the image process pool, so it takes plain arguments only. Files that
+    cannot be decoded are stored unchanged. Returns (bytes_in, bytes_out).
+    """
+    bytes_in = os.path.getsize(staged_path)
+    ext = dest_path.rsplit('.', 1)[1].lower()
+    try:
+        with Image.open(staged_path) as img:
+            if ext == 'gif':
+                # Keep animations untouched; the thumbnail uses the first frame
+                save_thumbnail(img.convert('RGBA'), thumb_path, thumb_size)
+                os.replace(staged_path, dest_path)
+                return bytes_in, bytes_in
+            if img.format == 'JPEG':
+                # Let the decoder downscale by a power of two first: much faster for phone photos
+                img.draft('RGB', (max_dimension, max_dimension))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            tmp_path = f'{dest_path}.tmp'
+            if ext in ('jpg', 'jpeg'):
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                img.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                img.save(tmp_path, 'PNG', optimize=True)
+            os.replace(tmp_path, dest_path)
+            save_thumbnail(img, thumb_path, thumb_size)
+    except Exception as e:
+        print(f"Warning: Could not process image {dest_path}, storing it unchanged: {str(e)}")
+        os.replace(staged_path, dest_path)
+        return bytes_in, bytes_in
+    os.remove(staged_path)
+    return bytes_in, os.path.getsize(dest_path)
+
+def get_image_pool():
+    global _image_pool
+    if _image_pool is None:
+        with _image_pool_lock:
+            if _image_pool is None:
+                # spawn: forking a process that runs job/worker threads is not safe
+                _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                                  mp_context=multiprocessing.get_context('spawn'))
+    return _image_pool
+
+@timed_phase('images')
+def store_images(pending):
+    """Move staged uploads [(staged_path, dest_path)] into place through the image pipeline.
+
+    Uploads seen before (same bytes, same settings) are linked to the stored
+    result without processing; the rest go through process_images and into the
+    blob store.
+    """
+    to_process = []
+    for staged_path, dest_path in pending:
+        source_key = get_image_source_key(staged_path, dest_path)
+        digest = lookup_image_source(source_key)
+        if digest and link_blob(digest, dest_path):
+            os.remove(staged_path)
+            thumb_path = get_thumb_path(dest_path)
+            if os.path.exists(thumb_path):
+                os.remove(thumb_path)  # made again on demand by /thumb
+            continue
+        to_process.append((staged_path, dest_path, source_key))
+    process_images([(staged_path, dest_path) for staged_path, dest_path, _ in to_process])
+    for _, dest_path, source_key in to_process:
+        digest = store_blob(dest_path)
+        if digest:
+            remember_image_source(source_key, digest)
+
+def process_images(pending):
+    """Resize/re-encode staged uploads [(staged_path, dest_path)] into place.
+
+    Several images are processed in parallel in the process pool; one image (or
+    IMAGE_WORKERS=1) is processed inline. Without Pillow files are moved as-is.
+    """
+    if Image is None:
+        for staged_path, dest_path in pending:
+            os.replace(staged_path, dest_path)
+        return
+    jobs = [(staged_path, dest_path, get_thumb_path(dest_path), IMAGE_MAX_DIMENSION, IMAGE_QUALITY, THUMB_SIZE)
+            for staged_path, dest_path in pending]
+    if len(jobs) < 2 or IMAGE_WORKERS <= 1:
+        for job in jobs:
+            process_image(*job)
+        return
+    global _image_pool
+    try:
+        futures = [get_image_pool().submit(process_image, *job) for job in jobs]
+        for future in futures:
+            future.result()
+    except BrokenProcessPool as e:
+        print(f"Warning: Image pool failed, processing inline: {str(e)}")
+        _image_pool = None
+        for job in jobs:
+            if os.path.exists(job[0]):
+                process_image(*job)
+
+def remove_thumbnails(tipe_properti, no=None):
+    """Delete the thumbnails of one listing (or of a whole property type)"""
+    parts = [THUMB_FOLDER, tipe_properti] + ([str(no)] if no is not None else [])
+    thumb_folder = os.path.join(*parts)
+    if os.path.exists(thumb_folder):
+        shutil.rmtree(thumb_folder, ignore_errors=True)
+
+def list_listing_images(tipe_properti, no):
+    """Image filenames of a listing, cover first then foto1, foto2, ..."""
+    property_folder = os.path.join(UPLOAD_FOLDER, tipe_properti, str(no))
+    if not os.path.isdir(property_folder):
+        return []
+    names = [name for name in os.listdir(property_folder) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    def order(name):
+        stem = os.path.splitext(name)[0].lower()
+        return (stem != 'cover', int(stem[4:]) if stem[4:].isdigit() else 0, stem)
+    return sorted(names, key=order)
+
+# ---------------------------------------------------------------------------
+# Content-addressed image store: every stored image is a hardlink to
+# uploads/.blobs/{sha[:2]}/{sha256}, so identical photos share one file on disk.
+# image_sources maps the hash of a raw upload (plus the pipeline settings) to
+# the stored result, so a re-posted photo skips the image pipeline entirely.
+# A blob with link count 1 is no longer used by any listing (see gc_blobs).
+# ---------------------------------------------------------------------------
+
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def get_blob_path(digest):
+    return os.path.join(BLOB_FOLDER, digest[:2], digest)
+
+def get_image_source_key(staged_path, dest_path):
+    """Key of a raw upload: its hash plus everything that changes the processed result"""
+    ext = dest_path.rsplit('.', 1)[1].lower()
+    pipeline = f'{IMAGE_MAX_DIMENSION}:{IMAGE_QUALITY}' if Image is not None else 'raw'
+    return f'{file_sha256(staged_path)}:{ext}:{pipeline}'
+
+def lookup_image_source(source_key):
+    with closing(get_db()) as conn:
+        row = conn.execute("SELECT digest FROM image_sources WHERE source_key = ?", (source_key,)).fetchone()
+    return row['digest'] if row else None
+
+def remember_image_source(source_key, digest):
+    with closing(get_db()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO image_sources (source_key, digest) VALUES (?, ?)",
+                     (source_key, digest))
+
+def replace_with_link(src_path, dest_path):
+    """Atomically make dest_path a hardlink of src_path"""
+    tmp_path = f'{dest_path}.link'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    os.link(src_path, tmp_path)
+    os.replace(tmp_path, dest_path)
+
+@with_write_lock
+def link_blob(digest, dest_path):
+    """Point dest_path at an existing blob; False if the blob is gone (collected)"""
+    blob_path = get_blob_path(digest)
+    try:
+        if not (os.path.exists(dest_path) and os.path.samefile(blob_path, dest_path)):
+            # Re-linking the same blob keeps size/mtime, so the ZIP entry stays valid
+            replace_with_link(blob_path, dest_path)
+    except OSError:
+        return False
+    incr_blob_counter('blob_reused')
+    return True
+
+@with_write_lock
+def store_blob(path):
+    """Move an image into the blob store, leaving path as a hardlink. Returns its digest.
+
+    If the same content is already stored, path is replaced by a link to it. On
+    filesystems without hardlinks the file stays a plain copy (None).
+    """
+    digest = file_sha256(path)
+    blob_path = get_blob_path(digest)
+    try:
+        if os.path.exists(blob_path):
+            if not os.path.samefile(blob_path, path):
+                replace_with_link(blob_path, path)
+                incr_blob_counter('blob_reused')
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.link(path, blob_path)
+    except OSError as e:
+        print(f"Warning: Could not add {path} to the blob store: {str(e)}")
+        return None
+    return digest
+
+def incr_blob_counter(key):
+    with closing(get_db()) as conn, conn:
+        incr_meta(conn, key)
+
+@with_write_lock
+def gc_blobs():
+    """Delete blobs no listing links to any more. Returns (blobs removed, bytes freed)"""
+    removed, freed = [], 0
+    for root, dirs, files in os.walk(BLOB_FOLDER):
+        for name in files:
+            blob_path = os.path.join(root, name)
+            st = os.stat(blob_path)
+            if st.st_nlink == 1:
+                os.remove(blob_path)
+                removed.append(name)
+                freed += st.st_size
+    if removed:
+        with closing(get_db()) as conn, conn:
+            conn.executemany("DELETE FROM image_sources WHERE digest = ?", [(d,) for d in removed])
+    return len(removed), freed
+
+@job_handler('blob-gc')
+def run_blob_gc_job(payload):
+    gc_blobs()
+
+def clear_blob_store():
+    """Drop all blobs and the source index (used by reset-all)"""
+    if os.path.exists(BLOB_FOLDER):
+        shutil.rmtree(BLOB_FOLDER, ignore_errors=True)
+    with closing(get_db()) as conn, conn:
+        conn.execute("DELETE FROM image_sources")
+
+def dedup_stats():
+    """How much disk the blob store saves: listing images vs. distinct files behind them"""
+    logical_bytes = physical_bytes = files = 0
+    seen_inodes = set()
+    for file_path, _ in iter_archive_sources():
+        st = os.stat(file_path)
+        files += 1
+        logical_bytes += st.st_size
+        if (st.st_dev, st.st_ino) not in seen_inodes:
+            seen_inodes.add((st.st_dev, st.st_ino))
+            physical_bytes += st.st_size
+    blobs = unused_blobs = 0
+    for root, dirs, names in os.walk(BLOB_FOLDER):
+        for name in names:
+            blobs += 1
+            if os.stat(os.path.join(root, name)).st_nlink == 1:
+                unused_blobs += 1
+    with closing(get_db()) as conn:
+        reused = int(get_meta(conn, 'blob_reused', 0))
+    return {
+        'images': files,
+        'distinct_images': len(seen_inodes),
+        'logical_bytes': logical_bytes,
+        'stored_bytes': physical_bytes,
+        'saved_bytes': logical_bytes - physical_bytes,
+        'saved_ratio': round(1 - physical_bytes / logical_bytes, 4) if logical_bytes else 0.0,
+        'blobs': blobs,
+        'unused_blobs': unused_blobs,
+        'reused_uploads': reused,
+    }
+
+@app.cli.command('dedup-images')
+def dedup_images_command():
+    """Move existing listing images into the blob store and drop unused blobs."""
+    for file_path, _ in list(iter_archive_sources()):
+        store_blob(file_path)
+    removed, freed = gc_blobs()
+    stats = dedup_stats()
+    click.echo(f"{stats['images']} gambar, {stats['distinct_images']} unik, "
+               f"hemat {stats['saved_bytes']} bytes; {removed} blob dihapus ({freed} bytes)")
+
+# Fields that must be numeric when present (same as the number inputs in the form)
+NUMERIC_FIELDS = {'harga', 'luas_tanah', 'luas_bangunan', 'kamar_tidur', 'kamar_mandi', 'jumlah_lantai', 'carport'}
+IMPORT_ERROR_LIMIT = 10
+# Rows numbered and committed per write during an import
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '500'))
+
+def iter_import_rows(file_storage):
+    """Stream (row_label, {header: value}) from an uploaded CSV or XLSX file"""
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        wb = load_workbook(file_storage.stream, read_only=True, data_only=True)
+        try:
+            for sheet_name in wb.sheetnames:
+                row_iter = wb[sheet_name].iter_rows(values_only=True)
+                first_row = next(row_iter, None) or ()
+                headers = [str(value).strip() if value is not None else '' for value in first_row]
+                for row_number, row in enumerate(row_iter, start=2):
+                    yield f'{sheet_name}!{row_number}', dict(zip(headers, row))
+        finally:
+            wb.close()
+    elif filename.endswith('.csv'):
+        stream = io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+        sample = stream.read(4096)
+        stream.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        for row_number, row in enumerate(csv.DictReader(stream, dialect=dialect), start=2):
+            yield f'baris {row_number}', row
+    else:
+        raise ValueError('Format file harus .csv atau .xlsx')
+
+def normalize_import_row(raw_row):
+    """Validate one imported row. Returns (tipe_properti, source_no, data) or raises ValueError"""
+    header_mapping = create_header_mapping(None)
+    fields = {}
+    for header, value in raw_row.items():
+        if not header:
+            continue
+        header = str(header).strip()
+        field = header_mapping.get(header) or header_mapping.get(header.lower()) or header.lower().replace(' ', '_')
+        if isinstance(value, str):
+            value = value.strip()
+        fields[field] = '' if value is None else value
     
-    if os.path.exists(zip_file):
-        os.remove(zip_file)
+    if not any(value not in ('', None) for key, value in fields.items() if key != 'no'):
+        return None  # Empty row
     
-    with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        # Add Excel file - ensure it exists and is readable
-        if os.path.exists(EXCEL_FILE):
-            try:
-                # Read Excel file into memory to avoid file lock issues
-                with open(EXCEL_FILE, 'rb') as f:
-                    excel_data = f.read()
-                zipf.writestr('mass_upload_template.xlsx', excel_data)
-            except Exception as e:
-                print(f"Warning: Could not add Excel to ZIP: {str(e)}")
+    tipe_raw = str(fields.get('tipe_properti', '')).strip()
+    tipe_properti = validate_tipe_properti(tipe_raw) if tipe_raw else None
+    if not tipe_properti:
+        raise ValueError(f'tipe properti tidak valid: "{tipe_raw}"')
+    
+    # Keep only the columns that exist for this property type
+    allowed = {header_mapping.get(h, h.lower().replace(' ', '_')) for h in get_excel_columns(tipe_properti)}
+    data = {field: value for field, value in fields.items() if field in allowed}
+    
+    for field in NUMERIC_FIELDS & data.keys():
+        value = data[field]
+        if value in ('', None) or isinstance(value, (int, float)):
+            continue
+        try:
+            float(str(value).replace('.', '').replace(',', '.'))
+        except ValueError:
+            raise ValueError(f'{field} harus berupa angka: "{value}"')
+    
+    source_no = fields.get('no', '')
+    if isinstance(source_no, float) and source_no.is_integer():
+        source_no = int(source_no)
+    data['tipe_properti'] = tipe_properti
+    return tipe_properti, str(source_no).strip(), data
+
+def extract_import_images(images_zip, number_map):
+    """Copy images laid out as {tipe}/{no}/... into uploads/{tipe}/{new_no}/.
+
+    number_map maps (tipe, source_no) to the allocated number. Files keep the
+    cover.{ext} / foto{n}.{ext} naming: an existing cover.* stays the cover,
+    otherwise the first image becomes the cover and the rest foto1, foto2, ...
+    Returns {(tipe, new_no): cover_filename}.
+    """
+    grouped = {}
+    with zipfile.ZipFile(images_zip.stream) as zipf:
+        for info in zipf.infolist():
+            parts = [p for p in info.filename.replace('\\', '/').split('/') if p]
+            if info.is_dir() or len(parts) < 3 or not allowed_file(parts[-1]):
+                continue
+            tipe = validate_tipe_properti(parts[-3])
+            new_no = number_map.get((tipe, parts[-2]))
+            if new_no is not None:
+                grouped.setdefault((tipe, new_no), []).append(info)
         
-        # Walk through uploads folder and add image files with corrected path structure
-        for root, dirs, files in os.walk(UPLOAD_FOLDER):
-            for file in files:
-                if file.endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                    file_path = os.path.join(root, file)
-                    # Get relative path from UPLOAD_FOLDER
-                    rel_path = os.path.relpath(file_path, UPLOAD_FOLDER)
-                    # Don't include 'images' folder in the archive path
-                    # Example: uploads/rumah/1/cover.jpg -> rumah/1/cover.jpg
-                    parts = rel_path.split(os.sep)
-                    # Filter out 'images' directory
-                    filtered_parts = [p for p in parts if p != 'images']
-                    arcname = os.sep.join(filtered_parts)
-                    try:
-                        zipf.write(file_path, arcname)
-                    except Exception as e:
-                        print(f"Warning: Could not add {file_path} to ZIP: {str(e)}")
+        covers = {}
+        pending = []
+        for (tipe, new_no), infos in grouped.items():
+            infos.sort(key=lambda i: (not os.path.basename(i.filename).lower().startswith('cover.'), i.filename))
+            property_folder = os.path.join(UPLOAD_FOLDER, tipe, str(new_no))
+            os.makedirs(property_folder, exist_ok=True)
+            for idx, info in enumerate(infos):
+                ext = info.filename.rsplit('.', 1)[1].lower()
+                filename = f'cover.{ext}' if idx == 0 else f'foto{idx}.{ext}'
+                dest_path = os.path.join(property_folder, filename)
+                with zipf.open(info) as src, open(get_staged_path(dest_path), 'wb') as dest:
+                    shutil.copyfileobj(src, dest, ZIP_STREAM_CHUNK_SIZE)
+                pending.append((get_staged_path(dest_path), dest_path))
+                if idx == 0:
+                    covers[(tipe, new_no)] = filename
+    store_images(pending)
+    return covers
+
+def iter_parsed_import_rows(data_file, errors):
+    """Validated (tipe_properti, source_no, data) rows of an import file; invalid rows go to errors"""
+    per_tipe_seen = {}
+    for label, raw_row in iter_import_rows(data_file):
+        try:
+            parsed = normalize_import_row(raw_row)
+        except ValueError as e:
+            errors.append(f'{label}: {e}')
+            continue
+        if parsed is None:
+            continue
+        tipe_properti, source_no, data = parsed
+        per_tipe_seen[tipe_properti] = per_tipe_seen.get(tipe_properti, 0) + 1
+        # Without a 'no' column, images are matched by position within the type
+        yield tipe_properti, source_no or str(per_tipe_seen[tipe_properti]), data
+
+def import_listings(data_file, images_zip=None):
+    """Import listings from a CSV/XLSX (and optional image ZIP), IMPORT_CHUNK_SIZE rows per write.
+
+    Returns (imported_count, errors).
+    """
+    errors = []
+    imported, write_errors = insert_listing_rows(iter_parsed_import_rows(data_file, errors), images_zip)
+    return imported, errors + write_errors
+
+def insert_listing_rows(rows, images_zip=None):
+    """Number and write validated (tipe_properti, source_no, data) rows.
+
+    rows may be any iterable: it is consumed IMPORT_CHUNK_SIZE rows at a time,
+    and each chunk gets its own per-type number blocks and its own commit, so
+    only one chunk is held in memory. The archive is updated once at the end.
+    Returns (inserted_count, errors).
+    """
+    inserted, errors = 0, []
+    claimed_sources = set()
+    row_iter = iter(rows)
+    while True:
+        chunk = list(islice(row_iter, IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        chunk_inserted, chunk_errors = _insert_listing_chunk(chunk, images_zip, claimed_sources)
+        inserted += chunk_inserted
+        errors.extend(chunk_errors)
+    if inserted:
+        refresh_archive()
+    return inserted, errors
+
+def _insert_listing_chunk(rows, images_zip, claimed_sources):
+    """Number, attach images to and commit one chunk of rows; returns (inserted_count, errors).
+    claimed_sources holds the (tipe, source_no) pairs whose images earlier chunks already took."""
+    # Reserve a contiguous block of numbers per type
+    counts = {}
+    for tipe_properti, source_no, data in rows:
+        counts[tipe_properti] = counts.get(tipe_properti, 0) + 1
+    next_numbers = {tipe: get_next_no(tipe, count) for tipe, count in counts.items()}
+    number_map = {}
+    for tipe_properti, source_no, data in rows:
+        data['no'] = next_numbers[tipe_properti]
+        next_numbers[tipe_properti] += 1
+        if (tipe_properti, source_no) not in claimed_sources:
+            claimed_sources.add((tipe_properti, source_no))
+            number_map[(tipe_properti, source_no)] = data['no']
+    
+    if images_zip and images_zip.filename and number_map:
+        covers = extract_import_images(images_zip, number_map)
+        for tipe_properti, source_no, data in rows:
+            cover = covers.get((tipe_properti, data['no']))
+            if cover:
+                data['gambar_cover_utama'] = cover
+    
+    errors = []
+    results = commit_writes([('insert', tipe, data) for tipe, source_no, data in rows])
+    for (tipe, source_no, data), result in zip(rows, results):
+        if isinstance(result, Exception):
+            errors.append(f'{tipe} {source_no}: {result}')
+    return sum(1 for r in results if not isinstance(r, Exception)), errors
 
 @app.route('/')
 def index():
-    data = read_excel_data()
-    return render_template('index.html', data=data)
+    query = parse_listing_query(request.args)
+    data, total = query_listings(query)
+    pages = max(1, -(-total // query['per_page']))
+    if query['page'] > pages:
+        query['page'] = pages
+        data, total = query_listings(query)
+    # Query-string arguments that keep the current filters across pages
+    filter_args = {key: value for key, value in request.args.items() if key != 'page' and value}
+    filtered = any(query[field] for field in LISTING_FILTER_FIELDS) or \
+        query['harga_min'] is not None or query['harga_max'] is not None
+    return render_template('index.html', data=data, total=total, pages=pages, query=query,
+                           filter_args=filter_args, filtered=filtered, sorts=LISTING_SORTS, page_sizes=LISTING_PAGE_SIZES,
+                           tipe_options=sorted(t for t in ALLOWED_TIPE_PROPERTI if ' ' not in t))
+
+def wants_no_cache(data):
+    """Bypass flag for the AI cache: JSON "no_cache": true or ?no_cache=1"""
+    return bool(data.get('no_cache')) or request.args.get('no_cache') in ('1', 'true')
+
+@app.route('/ai-cache/stats')
+def ai_cache_stats_view():
+    return jsonify(ai_cache_stats())
+
+@app.route('/metrics')
+def metrics_view():
+    """Prometheus scrape endpoint (404 unless METRICS_ENABLED)"""
+    if not METRICS_ENABLED:
+        abort(404)
+    counters, histograms = collect_metrics()
+    # Shared state lives in the DB and on disk, so it is read at scrape time
+    with closing(get_db()) as conn:
+        counters[('ai_cache_hits_total', ())] = int(get_meta(conn, 'ai_cache_hits', 0))
+        counters[('ai_cache_misses_total', ())] = int(get_meta(conn, 'ai_cache_misses', 0))
+    gauges = {}
+    if os.path.exists(EXCEL_FILE):
+        gauges['workbook_size_bytes'] = os.path.getsize(EXCEL_FILE)
+    zip_file = get_current_zip_file()
+    if os.path.exists(zip_file):
+        gauges['archive_size_bytes'] = os.path.getsize(zip_file)
+    return Response(render_metrics(counters, histograms, gauges), mimetype='text/plain; version=0.0.4')
 
 @app.route('/parse-description', methods=['POST'])
 def parse_description():
@@ -766,7 +3882,7 @@ def parse_description():
         if not description:
             return jsonify({'error': 'Deskripsi tidak boleh kosong'}), 400
         
-        parsed_data = parse_listing_with_ai(description)
+        parsed_data = parse_listing_with_ai(description, use_cache=not wants_no_cache(data), mode=data.get('mode'))
         
         if 'error' in parsed_data:
             return jsonify(parsed_data), 500
@@ -775,6 +3891,81 @@ def parse_description():
     except Exception as e:
         return jsonify({'error': f'Terjadi kesalahan: {str(e)}'}), 500
 
+@app.route('/parse-description/stream', methods=['POST'])
+def parse_description_stream():
+    """SSE variant of /parse-description: fields arrive while the model writes them"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({'error': 'Request body harus berupa JSON yang valid'}), 400
+    
+    description = data.get('description', '')
+    if not description:
+        return jsonify({'error': 'Deskripsi tidak boleh kosong'}), 400
+    
+    mode = resolve_parser_mode(data.get('mode'))
+    fields, messages = build_parse_request(description, mode)
+    if messages is None:
+        return sse_response(iter([sse_event('done', build_offline_listing(fields, description))]))
+    return sse_response(stream_ai_json(
+        f'parse-{mode}', PARSER_SYSTEM_PROMPT, messages[-1]['content'], messages,
+        use_cache=not wants_no_cache(data), prefill=fields
+    ))
+
+@app.route('/parse-description-batch', methods=['POST'])
+def parse_description_batch():
+    """Split a dump of many listings and parse them concurrently into drafts"""
+    try:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({'error': 'Request body harus berupa JSON yang valid'}), 400
+        
+        descriptions = data.get('descriptions') or split_listing_dump(data.get('description', ''))
+        descriptions = [d.strip() for d in descriptions if isinstance(d, str) and d.strip()]
+        
+        if not descriptions:
+            return jsonify({'error': 'Deskripsi tidak boleh kosong'}), 400
+        if len(descriptions) > AI_BATCH_MAX_LISTINGS:
+            return jsonify({'error': f'Maksimal {AI_BATCH_MAX_LISTINGS} listing per batch'}), 400
+        
+        results = parse_listings_batch(descriptions, use_cache=not wants_no_cache(data), mode=data.get('mode'))
+        drafts = [{'source': source, 'data': result} for source, result in zip(descriptions, results)]
+        return jsonify({'drafts': drafts})
+    except Exception as e:
+        return jsonify({'error': f'Terjadi kesalahan: {str(e)}'}), 500
+
+@app.route('/submit-batch', methods=['POST'])
+def submit_batch():
+    """Save a list of (AI-prefilled) drafts in one write pass"""
+    csrf_token = request.headers.get('X-CSRF-Token')
+    if not csrf_token or not validate_csrf_token(csrf_token):
+        return jsonify({'success': False, 'error': 'Invalid CSRF token'}), 403
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        drafts = data.get('drafts')
+        if not isinstance(drafts, list) or not drafts:
+            return jsonify({'success': False, 'error': 'Tidak ada draft untuk disimpan'}), 400
+        
+        rows, errors = [], []
+        for idx, draft in enumerate(drafts, 1):
+            try:
+                parsed = normalize_import_row(draft if isinstance(draft, dict) else {})
+            except ValueError as e:
+                errors.append(f'Draft {idx}: {e}')
+                continue
+            if parsed is None:
+                errors.append(f'Draft {idx}: kosong')
+                continue
+            tipe_properti, source_no, row = parsed
+            rows.append((tipe_properti, str(idx), row))
+        
+        saved, write_errors = insert_listing_rows(rows)
+        errors += write_errors
+        return jsonify({'success': not errors, 'saved': saved, 'errors': errors,
+                        'message': f'{saved} iklan dari batch berhasil disimpan dan ZIP diperbarui'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/generate-listing', methods=['POST'])
 def generate_listing():
     """Generate professional judul_iklan and deskripsi_iklan from form data"""
@@ -787,7 +3978,7 @@ def generate_listing():
         if not tipe_properti:
             return jsonify({'error': 'Tipe properti harus ditentukan'}), 400
         
-        result = generate_professional_listing(data, tipe_properti)
+        result = generate_professional_listing(data, tipe_properti, use_cache=not wants_no_cache(data))
         
         if 'error' in result:
             return jsonify(result), 500
@@ -796,6 +3987,23 @@ def generate_listing():
     except Exception as e:
         return jsonify({'error': f'Terjadi kesalahan: {str(e)}'}), 500
 
+@app.route('/generate-listing/stream', methods=['POST'])
+def generate_listing_stream():
+    """SSE variant of /generate-listing: judul/kalimat pembuka/deskripsi arrive as they are written"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({'error': 'Request body harus berupa JSON yang valid'}), 400
+    
+    tipe_properti = data.get('tipe_properti', '')
+    if not tipe_properti:
+        return jsonify({'error': 'Tipe properti harus ditentukan'}), 400
+    
+    context = build_listing_context(data, tipe_properti)
+    return sse_response(stream_ai_json(
+        'listing', LISTING_SYSTEM_PROMPT, context, build_listing_messages(context),
+        finalize=finalize_listing_result, use_cache=not wants_no_cache(data)
+    ))
+
 @app.route('/submit', methods=['POST'])
 def submit():
     try:
@@ -824,12 +4032,15 @@ def submit():
         os.makedirs(property_folder, exist_ok=True)
         
         cover_filename = ''
+        pending_images = []
         if 'gambar_cover' in request.files:
             cover_file = request.files['gambar_cover']
             if cover_file and cover_file.filename and allowed_file(cover_file.filename):
                 ext = cover_file.filename.rsplit('.', 1)[1].lower()
                 cover_filename = f'cover.{ext}'
-                cover_file.save(os.path.join(property_folder, cover_filename))
+                dest_path = os.path.join(property_folder, cover_filename)
+                cover_file.save(get_staged_path(dest_path))
+                pending_images.append((get_staged_path(dest_path), dest_path))
         
         if 'gambar_lainnya' in request.files:
             other_files = request.files.getlist('gambar_lainnya')
@@ -837,7 +4048,12 @@ def submit():
                 if file and file.filename and allowed_file(file.filename):
                     ext = file.filename.rsplit('.', 1)[1].lower()
                     filename = f'foto{idx}.{ext}'
-                    file.save(os.path.join(property_folder, filename))
+                    dest_path = os.path.join(property_folder, filename)
+                    file.save(get_staged_path(dest_path))
+                    pending_images.append((get_staged_path(dest_path), dest_path))
+        
+        # Resize/re-encode all photos of this listing in parallel
+        store_images(pending_images)
         
         # Collect all form data including dynamic fields
         data = {
@@ -868,7 +4084,7 @@ def submit():
                 data[field] = request.form.get(field, '')
         
         save_to_excel(data, tipe_properti)
-        create_zip()
+        refresh_archive()
         
         flash(f'Iklan tipe {tipe_properti.upper()} berhasil disimpan dan ZIP diperbarui', 'success')
     except Exception as e:
@@ -876,41 +4092,176 @@ def submit():
     
     return redirect(url_for('index'))
 
+@app.route('/bulk-import', methods=['POST'])
+def bulk_import():
+    """Import many listings from a CSV/XLSX file plus an optional ZIP of images"""
+    csrf_token = request.form.get('csrf_token')
+    if not csrf_token or not validate_csrf_token(csrf_token):
+        flash('Invalid CSRF token. Operasi dibatalkan untuk keamanan.', 'danger')
+        return redirect(url_for('index'))
+    
+    data_file = request.files.get('data_file')
+    if not data_file or not data_file.filename:
+        flash('Pilih file CSV atau XLSX untuk diimpor', 'danger')
+        return redirect(url_for('index'))
+    
+    try:
+        imported, errors = import_listings(data_file, request.files.get('images_zip'))
+        if imported:
+            flash(f'{imported} iklan berhasil diimpor dan ZIP diperbarui', 'success')
+        if errors:
+            shown = '; '.join(errors[:IMPORT_ERROR_LIMIT])
+            more = f' (+{len(errors) - IMPORT_ERROR_LIMIT} lainnya)' if len(errors) > IMPORT_ERROR_LIMIT else ''
+            flash(f'{len(errors)} baris dilewati: {shown}{more}', 'warning')
+        if not imported and not errors:
+            flash('File tidak berisi data', 'warning')
+    except (ValueError, zipfile.BadZipFile) as e:
+        flash(f'File tidak valid: {str(e)}', 'danger')
+    except Exception as e:
+        flash(f'Terjadi kesalahan: {str(e)}', 'danger')
+    
+    return redirect(url_for('index'))
+
 @app.route('/download/excel')
 def download_excel():
+    ensure_excel_export()
     if os.path.exists(EXCEL_FILE):
-        return send_file(EXCEL_FILE, as_attachment=True, download_name='mass_upload_template.xlsx')
+        return send_file(os.path.abspath(EXCEL_FILE), as_attachment=True, download_name='mass_upload_template.xlsx')
     flash('File Excel tidak ditemukan', 'warning')
     return redirect(url_for('index'))
 
 @app.route('/download/zip')
 def download_zip():
+    if ARCHIVE_MODE in ('lazy', 'background'):
+        # While the background rebuild is pending, stream a fresh ZIP instead of the outdated one
+        ensure_excel_export()
+        zip_file = get_current_zip_file()
+        if not is_archive_dirty() and os.path.exists(zip_file):
+            return send_file(os.path.abspath(zip_file), as_attachment=True, download_name=os.path.basename(zip_file))
+        if os.path.exists(EXCEL_FILE):
+            filename = os.path.basename(get_zip_filename())
+            return Response(
+                stream_with_context(generate_zip_stream()),
+                mimetype='application/zip',
+                headers={'Content-Disposition': f'attachment; filename={filename}'}
+            )
+        flash('File ZIP tidak ditemukan', 'warning')
+        return redirect(url_for('index'))
+    
     zip_file = get_current_zip_file()
     if os.path.exists(zip_file):
         filename = os.path.basename(zip_file)
-        return send_file(zip_file, as_attachment=True, download_name=filename)
+        return send_file(os.path.abspath(zip_file), as_attachment=True, download_name=filename)
     flash('File ZIP tidak ditemukan', 'warning')
     return redirect(url_for('index'))
 
+@app.route('/jobs/status')
+def jobs_status():
+    """Archive state and job queue counters (polled by the page badge)"""
+    with closing(get_db()) as conn:
+        counts = {row['status']: row['n'] for row in
+                  conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        recent = conn.execute(
+            "SELECT id, kind, status, attempts, error, created_at, finished_at FROM jobs ORDER BY id DESC LIMIT 10"
+        ).fetchall()
+    return jsonify({
+        'archive': get_archive_state(),
+        'archive_mode': ARCHIVE_MODE,
+        'counts': counts,
+        'recent': [dict(row) for row in recent],
+    })
+
+@app.route('/search')
+def search():
+    """Full-text search: /search?q=rumah cibubur 1,5M&limit=20"""
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(1, int(request.args.get('limit', 20))), SEARCH_MAX_RESULTS)
+    except ValueError:
+        limit = 20
+    start = time.perf_counter()
+    try:
+        matches = search_listings(query, limit)
+    except sqlite3.OperationalError as e:
+        return jsonify({'error': f'Pencarian gagal: {str(e)}'}), 400
+    results = []
+    for item, score in matches:
+        results.append({
+            'tipe_properti': item.get('tipe properti') or item.get('tipe_properti', ''),
+            'no': item.get('no'),
+            'judul_iklan': item.get('judul iklan') or item.get('judul_iklan', ''),
+            'id_area': item.get('id area') or item.get('id_area', ''),
+            'harga': item.get('harga'),
+            'status': item.get('Status') or item.get('status', ''),
+            'score': round(score, 3),
+        })
+    return jsonify({'query': query, 'results': results,
+                    'took_ms': round((time.perf_counter() - start) * 1000, 2)})
+
+@app.route('/profiles')
+def profiles_index():
+    """Recent request profiles (404 unless profiling is on and the token matches)"""
+    token = request.headers.get('X-Profile-Token') or request.args.get('profile_token', '')
+    if not has_profile_token(token):
+        abort(404)
+    return render_template('profiles.html', profiles=list_profiles(), token=token)
+
+@app.route('/profiles/<filename>')
+def download_profile(filename):
+    token = request.headers.get('X-Profile-Token') or request.args.get('profile_token', '')
+    filename = secure_filename(filename)
+    if not has_profile_token(token) or not PROFILE_FILENAME_RE.match(filename):
+        abort(404)
+    path = os.path.join(PROFILE_FOLDER, filename)
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=filename)
+
+@app.route('/storage/dedup')
+def storage_dedup():
+    """Dedup report of the image blob store"""
+    return jsonify(dedup_stats())
+
+@app.route('/thumb/<tipe>/<no>/<filename>')
+def thumbnail(tipe, no, filename):
+    """Thumbnail of a listing image (made on demand for images stored before the pipeline)"""
+    tipe = validate_tipe_properti(tipe)
+    filename = secure_filename(filename)
+    if not tipe or not no.isdigit() or not allowed_file(filename):
+        abort(404)
+    image_path = os.path.join(UPLOAD_FOLDER, tipe, no, filename)
+    if not os.path.exists(image_path):
+        abort(404)
+    if Image is None:
+        return send_file(os.path.abspath(image_path))
+    thumb_path = get_thumb_path(image_path)
+    if not os.path.exists(thumb_path):
+        try:
+            with Image.open(image_path) as img:
+                save_thumbnail(ImageOps.exif_transpose(img), thumb_path, THUMB_SIZE)
+        except Exception as e:
+            print(f"Warning: Could not create thumbnail for {image_path}: {str(e)}")
+            return send_file(os.path.abspath(image_path))
+    return send_file(os.path.abspath(thumb_path), mimetype='image/jpeg')
+
 @app.route('/load-data/<tipe>/<no>', methods=['GET'])
 def load_data(tipe, no):
     """Load property data for editing"""
     try:
         tipe = validate_tipe_properti(tipe) if validate_tipe_properti(tipe) else tipe
-        data = read_excel_data()
+        item = get_listing(tipe, no)
         
-        # Find the data matching tipe and no
-        for item in data:
-            item_tipe = item.get('tipe properti') or item.get('tipe_properti', '')
-            item_no = str(item.get('no', ''))
-            
-            if item_tipe.lower() == tipe.lower() and item_no == str(no):
-                # Convert spaces to underscores in keys for JavaScript
-                result = {}
-                for key, value in item.items():
-                    new_key = key.lower().replace(' ', '_')
-                    result[new_key] = value
-                return jsonify(result)
+        if item is not None:
+            # Convert spaces to underscores in keys for JavaScript
+            result = {}
+            for key, value in item.items():
+                new_key = key.lower().replace(' ', '_')
+                result[new_key] = value
+            result['images'] = [
+                {'name': name, 'thumb': url_for('thumbnail', tipe=tipe, no=no, filename=name)}
+                for name in list_listing_images(tipe, no)
+            ]
+            return jsonify(result)
         
         return jsonify({'error': f'Data tidak ditemukan untuk {tipe} nomor {no}'}), 404
     except Exception as e:
@@ -932,9 +4283,6 @@ def update_data():
             flash('Tipe properti dan nomor harus ada', 'danger')
             return redirect(url_for('index'))
         
-        # Read current data to delete old row
-        data = read_excel_data()
-        
         # Collect updated form data
         updated_data = {
             'no': no,
@@ -964,7 +4312,7 @@ def update_data():
         
         # Update Excel - remove old row and add new one
         update_excel_row(tipe_properti, no, updated_data)
-        create_zip()
+        refresh_archive()
         
         flash(f'Data {tipe_properti} nomor {no} berhasil diperbarui', 'success')
     except Exception as e:
@@ -989,41 +4337,14 @@ def delete_data():
             return jsonify({'success': False, 'error': 'Missing tipe_properti or no'}), 400
         
         # Delete from Excel
-        if os.path.exists(EXCEL_FILE):
-            wb = load_workbook(EXCEL_FILE)
-            sheet_name = tipe_properti
-            
-            if sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                
-                # Find and delete the row with matching no
-                # The first column is 'no' (with index 1 in openpyxl, 0-based is cell column A)
-                rows_to_delete = []
-                for row_idx in range(2, ws.max_row + 1):  # Start from row 2 (skip header)
-                    cell_value = ws.cell(row=row_idx, column=1).value  # Column A is 'no'
-                    if cell_value and str(cell_value).strip() == no:
-                        rows_to_delete.append(row_idx)
-                
-                # Delete rows in reverse order to maintain correct indices
-                for row_idx in sorted(rows_to_delete, reverse=True):
-                    ws.delete_rows(row_idx, 1)
-                
-                if rows_to_delete:
-                    wb.save(EXCEL_FILE)
-            
-            wb.close()
+        delete_excel_rows(tipe_properti, no)
         
         # Delete property folder with images
-        property_folder = os.path.join(UPLOAD_FOLDER, tipe_properti, str(no))
-        if os.path.exists(property_folder):
-            try:
-                shutil.rmtree(property_folder)
-            except Exception as e:
-                print(f"Warning: Could not delete property folder: {str(e)}")
+        remove_listing_files([(tipe_properti, no)])
         
-        # Recreate ZIP file with remaining data
+        # Update ZIP file with remaining data
         try:
-            create_zip()
+            refresh_archive()
         except Exception as e:
             print(f"Warning: Could not recreate ZIP file: {str(e)}")
         
@@ -1035,7 +4356,72 @@ def delete_data():
         print(traceback.format_exc())
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def parse_listing_pairs(data):
+    """Validated, de-duplicated (tipe_properti, no) pairs from {"items": [...]} (ValueError if invalid)"""
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('Tidak ada data yang dipilih')
+    pairs = []
+    for item in items:
+        tipe_properti = validate_tipe_properti(str((item or {}).get('tipe_properti', '')))
+        no = str((item or {}).get('no', '')).strip()
+        if not tipe_properti or not no.isdigit():
+            raise ValueError(f'Data tidak valid: {item}')
+        pairs.append((tipe_properti, no))
+    return list(dict.fromkeys(pairs))
+
+@app.route('/update-batch', methods=['POST'])
+def update_batch():
+    """Set fields on several listings at once: JSON {"items": [...], "changes": {"status": "Tunda", ...}}"""
+    csrf_token = request.headers.get('X-CSRF-Token')
+    if not csrf_token or not validate_csrf_token(csrf_token):
+        return jsonify({'success': False, 'error': 'Invalid CSRF token'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes')
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({'success': False, 'error': 'Tidak ada perubahan'}), 400
+    for field, value in changes.items():
+        if field not in PATCHABLE_FIELDS:
+            return jsonify({'success': False, 'error': f'Field tidak bisa diubah massal: {field}'}), 400
+        allowed = PATCHABLE_FIELDS[field]
+        if not isinstance(value, str) or (allowed is not None and value not in allowed):
+            return jsonify({'success': False, 'error': f'Nilai tidak valid untuk {field}: {value}'}), 400
+    try:
+        pairs = parse_listing_pairs(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        updated = patch_listings(pairs, {field: value.strip() for field, value in changes.items()})
+    except Exception as e:
+        print(f"Error in update_batch: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'updated': updated,
+                    'message': f'{updated} data berhasil diperbarui'})
+
+@app.route('/delete-batch', methods=['POST'])
+def delete_batch():
+    """Delete several listings at once: JSON {"items": [{"tipe_properti": .., "no": ..}, ...]}"""
+    csrf_token = request.headers.get('X-CSRF-Token')
+    if not csrf_token or not validate_csrf_token(csrf_token):
+        return jsonify({'success': False, 'error': 'Invalid CSRF token'}), 403
+    
+    try:
+        pairs = parse_listing_pairs(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        deleted = delete_listings(pairs)
+    except Exception as e:
+        print(f"Error in delete_batch: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'deleted': deleted,
+                    'message': f'{deleted} data berhasil dihapus'})
+
 @app.route('/reset-all', methods=['POST'])
+@with_write_lock
 def reset_all():
     csrf_token = request.form.get('csrf_token')
     if not csrf_token or not validate_csrf_token(csrf_token):
@@ -1074,12 +4460,25 @@ def reset_all():
                         print(f"Warning: Could not remove ZIP file {zf}: {str(e)}")
             except Exception as e:
                 print(f"Warning: Error removing ZIP files: {str(e)}")
+            
+            for state_file in (ARCHIVE_MANIFEST, ARCHIVE_DIRTY_FLAG):
+                if os.path.exists(state_file):
+                    os.remove(state_file)
+            if os.path.exists(THUMB_FOLDER):
+                shutil.rmtree(THUMB_FOLDER, ignore_errors=True)
+            clear_blob_store()
         
         # Ensure upload folder exists
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
         
-        # Reinitialize Excel
-        init_excel()
+        # Reinitialize Excel and numbering
+        clear_pending_jobs()
+        reset_sequences()
+        if STORAGE_BACKEND == 'sqlite':
+            reset_listing_store()
+        else:
+            init_excel()
+        invalidate_listing_cache()
         
         flash('✅ Semua data berhasil direset! Nomor dan data kembali ke awal.', 'success')
     except Exception as e:
@@ -0,0 +1,143 @@
+"""Accuracy/latency benchmark for the listing parser.
+
+Runs the examples from TEST_AI_PARSER.md (description block + "Field yang
+Seharusnya Terisi" list) and a few extra listings through
+parse_listing_with_ai in each PARSER_MODE and reports field accuracy and
+latency. "offline" needs no API key; "hybrid" and "ai" call the model.
+
+Usage:
+    python bench_parser.py                       # offline only
+    python bench_parser.py --modes offline,hybrid,ai
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Measure the model, not the cache
+os.environ.setdefault('AI_CACHE_ENABLED', '0')
+sys.path.insert(0, REPO_DIR)
+import app  # noqa: E402
+
+AUTO = object()  # "(auto-generated)": any non-empty value counts
+
+EXTRA_CASES = [
+    ("Dijual rumah di Cibubur LT 120 LB 90 3KT 2KM harga 1,5M nego, SHM, semi furnished", {
+        'tipe_properti': 'rumah', 'kategori': 'dijual', 'id_area': 'Cibubur', 'harga': 1500000000,
+        'luas_tanah': 120, 'luas_bangunan': 90, 'kamar_tidur': 3, 'kamar_mandi': 2,
+        'sertifikat': 'SHM', 'kondisi_perabotan': 'Semi Furnished', 'judul_iklan': AUTO,
+    }),
+    ("Disewakan ruko 3 lantai di Kelapa Gading 150jt/tahun, LT/LB 75/200, 2 KM, HGB", {
+        'tipe_properti': 'ruko', 'kategori': 'disewa', 'id_area': 'Kelapa Gading', 'harga': 150000000,
+        'periode_sewa': 'per tahun', 'luas_tanah': 75, 'luas_bangunan': 200, 'kamar_mandi': 2,
+        'jumlah_lantai': 3, 'sertifikat': 'HGB', 'judul_iklan': AUTO,
+    }),
+    ("Dijual tanah kavling 500m2 di Bogor, SHM, harga 2,5 jt/m2. 2 km dari tol", {
+        'tipe_properti': 'tanah', 'kategori': 'dijual', 'id_area': 'Bogor', 'harga': 2500000,
+        'luas_tanah': 500, 'satuan_harga': '/m2', 'sertifikat': 'SHM', 'judul_iklan': AUTO,
+    }),
+    ("Sewa apartemen 2BR lantai 15 di Kuningan, furnished, Rp 8 juta per bulan", {
+        'tipe_properti': 'apartemen', 'kategori': 'disewa', 'id_area': 'Kuningan', 'harga': 8000000,
+        'periode_sewa': 'per bulan', 'kamar_tidur': 2, 'nomor_lantai': '15',
+        'kondisi_perabotan': 'Furnished', 'judul_iklan': AUTO,
+    }),
+    ("Kost 14 kamar di Denpasar, 3 lantai, disewakan 400juta/tahun, siap huni", {
+        'tipe_properti': 'kost', 'kategori': 'disewa', 'id_area': 'Denpasar', 'harga': 400000000,
+        'periode_sewa': 'per tahun', 'jumlah_lantai': 3, 'kondisi_properti': 'Bagus', 'judul_iklan': AUTO,
+    }),
+    # Regressions: SHGB is a HGB certificate, the area stops before the price, negated keywords
+    ("Dijual ruko SHGB 2 lantai di Bekasi harga 2M", {
+        'tipe_properti': 'ruko', 'kategori': 'dijual', 'id_area': 'Bekasi', 'harga': 2000000000,
+        'jumlah_lantai': 2, 'sertifikat': 'HGB', 'judul_iklan': AUTO,
+    }),
+    ("Jual tanah 5 ha di Sentul Rp 300rb/m2", {
+        'tipe_properti': 'tanah', 'kategori': 'dijual', 'id_area': 'Sentul', 'harga': 300000,
+        'luas_tanah': 5, 'satuan_tanah': 'ha', 'satuan_harga': '/m2', 'judul_iklan': AUTO,
+    }),
+    ("Dijual rumah di Depok tidak furnished 1M", {
+        'tipe_properti': 'rumah', 'kategori': 'dijual', 'id_area': 'Depok', 'harga': 1000000000,
+        'kondisi_perabotan': 'Unfurnished', 'judul_iklan': AUTO,
+    }),
+]
+
+
+def load_markdown_cases(path):
+    """(description, expected fields) pairs from TEST_AI_PARSER.md"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    header_mapping = app.create_header_mapping(None)
+    cases = []
+    for section in re.split(r'^## Contoh Deskripsi', text, flags=re.MULTILINE)[1:]:
+        block = re.search(r'```\n(.*?)```', section, re.DOTALL)
+        if not block:
+            continue
+        expected = {}
+        for label, value in re.findall(r'^- ✅ ([^:]+):\s*(.+)$', section, re.MULTILINE):
+            field = header_mapping.get(label.strip().lower())
+            if field:
+                expected[field] = AUTO if value.strip().startswith('(') else value.strip()
+        cases.append((block.group(1).strip(), expected))
+    return cases
+
+
+def values_match(actual, expected):
+    if expected is AUTO:
+        return bool(str(actual or '').strip())
+    try:
+        return float(actual) == float(expected)
+    except (TypeError, ValueError):
+        return str(actual or '').strip().lower() == str(expected).strip().lower()
+
+
+def run_mode(mode, cases):
+    latencies, correct, total, misses = [], 0, 0, {}
+    for description, expected in cases:
+        start = time.perf_counter()
+        result = app.parse_listing_with_ai(description, use_cache=False, mode=mode)
+        latencies.append(time.perf_counter() - start)
+        if 'error' in result:
+            print(f'  [{mode}] {result["error"]}')
+        for field, value in expected.items():
+            total += 1
+            if values_match(result.get(field), value):
+                correct += 1
+            else:
+                misses[field] = misses.get(field, 0) + 1
+    return latencies, correct, total, misses
+
+
+def format_seconds(seconds):
+    return f'{seconds * 1000:.1f} ms' if seconds >= 0.001 else f'{seconds * 1e6:.0f} µs'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='offline', help='comma-separated: offline,hybrid,ai')
+    parser.add_argument('--repeat', type=int, default=1000, help='iterations for the extractor timing')
+    args = parser.parse_args()
+
+    cases = load_markdown_cases(os.path.join(REPO_DIR, 'TEST_AI_PARSER.md')) + EXTRA_CASES
+    print(f'{len(cases)} listings, {sum(len(e) for _, e in cases)} expected fields')
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for description, _ in cases:
+            app.extract_listing_fields(description)
+    per_call = (time.perf_counter() - start) / (args.repeat * len(cases))
+    print(f'extract_listing_fields: {format_seconds(per_call)} per listing')
+
+    for mode in args.modes.split(','):
+        mode = mode.strip()
+        latencies, correct, total, misses = run_mode(mode, cases)
+        print(f'{mode:8} accuracy {correct}/{total} ({correct / total:.0%})  '
+              f'latency p50 {format_seconds(statistics.median(latencies))}  '
+              f'max {format_seconds(max(latencies))}')
+        if misses:
+            print('         missed: ' + ', '.join(f'{field} x{n}' for field, n in sorted(misses.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Benchmark for the storage and export hot paths.
+
+Seeds a fresh uploads/ folder with synthetic listings spread over all
+EXCEL_COLUMNS_BY_TYPE types (each with a cover and one extra photo), then
+times get_next_no, save_to_excel, update_excel_row, read_excel_data (cold
+and cached), a delete through /delete-data, the index page, the workbook
+export (SQLite store only), create_zip (full and incremental) and an
+end-to-end /submit through the Flask test client. Every backend/size runs
+in its own process and temp folder.
+
+The JSON report can be compared with one from another commit; operations
+whose median got slower than --threshold are reported and make the script
+exit with status 1.
+
+Usage:
+    python bench_storage.py --sizes 100,1000,10000 --output bench.json
+    python bench_storage.py --sizes 100,1000 --backends excel --compare bench.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+AREAS = ['Cibubur', 'Kelapa Gading', 'Bekasi', 'Depok', 'Bogor', 'Denpasar', 'Kuningan', 'Sentul']
+WORDS = ('strategis dekat tol akses mudah lingkungan asri aman nyaman siap huni harga nego '
+         'shm imb lengkap bebas banjir dekat sekolah mall rumah sakit stasiun').split()
+NUMERIC_FIELDS = {'harga', 'luas_tanah', 'luas_bangunan', 'kamar_tidur', 'kamar_mandi', 'jumlah_lantai', 'carport'}
+
+
+def make_image(seed):
+    """A small real JPEG (noise, so it doesn't compress away) when Pillow is available"""
+    rng = random.Random(seed)
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + rng.randbytes(4096) + b'\xff\xd9'
+    img = Image.frombytes('RGB', (96, 64), rng.randbytes(96 * 64 * 3))
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def make_listing(app, rng, tipe, no):
+    """Field-name dict with a plausible value for every column of this type"""
+    header_mapping = app.create_header_mapping(tipe)
+    data = {}
+    for header in app.get_excel_columns(tipe):
+        field = header_mapping.get(header, header.lower().replace(' ', '_'))
+        if field in NUMERIC_FIELDS:
+            data[field] = rng.randint(1, 500) * (10**7 if field == 'harga' else 1)
+        else:
+            data[field] = ' '.join(rng.choices(WORDS, k=3))
+    data.update({
+        'no': no, 'tipe_properti': tipe,
+        'kategori': rng.choice(['dijual', 'disewa']),
+        'id_area': rng.choice(AREAS),
+        'judul_iklan': f'{tipe.title()} {" ".join(rng.choices(WORDS, k=5))}',
+        'deskripsi_iklan': ' '.join(rng.choices(WORDS, k=60)),
+        'status': rng.choice(['Tayang', 'Tunda']),
+        'gambar_cover_utama': 'cover.jpg',
+    })
+    return data
+
+
+def seed(app, size, rng):
+    types = list(app.EXCEL_COLUMNS_BY_TYPE)
+    counts = {tipe: size // len(types) + (1 if idx < size % len(types) else 0) for idx, tipe in enumerate(types)}
+    images = [make_image(i) for i in range(8)]
+    ops = []
+    for tipe, count in counts.items():
+        if not count:
+            continue
+        first = app.get_next_no(tipe, count=count)
+        for no in range(first, first + count):
+            ops.append(('insert', tipe, make_listing(app, rng, tipe, no)))
+            folder = os.path.join(app.UPLOAD_FOLDER, tipe, str(no))
+            os.makedirs(folder, exist_ok=True)
+            for name in ('cover.jpg', 'foto1.jpg'):
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(rng.choice(images))
+    app.commit_writes(ops)
+    return [(op[1], op[2]['no']) for op in ops]
+
+
+def measure(func, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        times.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(times), 3), 'min_ms': round(min(times), 3),
+            'max_ms': round(max(times), 3), 'runs': repeat}
+
+
+def run_case(backend, size, repeat, results):
+    workdir = tempfile.mkdtemp(prefix=f'bench_{backend}_{size}_')
+    os.chdir(workdir)
+    os.environ.update({
+        'STORAGE_BACKEND': backend,
+        'ARCHIVE_MODE': 'background',
+        'JOB_WORKERS': '0',  # create_zip is timed on its own, no worker threads in the way
+        'GROUP_COMMIT_WINDOW_MS': '0',
+        'AI_CACHE_ENABLED': '0',
+    })
+    sys.path.insert(0, REPO_DIR)
+    import app
+
+    rng = random.Random(size)
+    start = time.perf_counter()
+    listings = seed(app, size, rng)
+    seed_seconds = time.perf_counter() - start
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['_csrf_token'] = 'bench'
+    types = list(app.EXCEL_COLUMNS_BY_TYPE)
+    upload = make_image(99)
+    ops = {}
+
+    ops['get_next_no'] = measure(lambda i: app.get_next_no(types[i % len(types)]), repeat)
+
+    def save(i):
+        tipe = types[i % len(types)]
+        app.save_to_excel(make_listing(app, rng, tipe, app.get_next_no(tipe)), tipe)
+    ops['save_to_excel'] = measure(save, repeat)
+
+    def update(i):
+        tipe, no = rng.choice(listings)
+        app.update_excel_row(tipe, no, make_listing(app, rng, tipe, no))
+    ops['update_excel_row'] = measure(update, repeat)
+
+    def read_cold(i):
+        app.invalidate_listing_cache()
+        app.read_excel_data()
+    ops['read_excel_data_cold'] = measure(read_cold, repeat)
+    ops['read_excel_data_cached'] = measure(lambda i: app.read_excel_data(), repeat)
+    client.get('/')  # compile the template outside the timing
+    ops['index_page'] = measure(lambda i: client.get('/'), repeat)
+
+    def delete(i):
+        tipe, no = listings.pop(rng.randrange(len(listings)))
+        response = client.post('/delete-data', json={'tipe_properti': tipe, 'no': no},
+                               headers={'X-CSRF-Token': 'bench'})
+        assert response.get_json().get('success'), response.get_json()
+    ops['delete_data'] = measure(delete, repeat)
+
+    if backend == 'sqlite':
+        def export(i):
+            # The workbook is re-exported from the store whenever the file is missing
+            if os.path.exists(app.EXCEL_FILE):
+                os.remove(app.EXCEL_FILE)
+            app.ensure_excel_export()
+        ops['excel_export'] = measure(export, repeat)
+
+    def zip_full(i):
+        for name in os.listdir(app.UPLOAD_FOLDER):
+            if name.endswith('.zip') or name == os.path.basename(app.ARCHIVE_MANIFEST):
+                os.remove(os.path.join(app.UPLOAD_FOLDER, name))
+        app.create_zip()
+    ops['create_zip_full'] = measure(zip_full, max(1, repeat // 2))
+
+    def zip_incremental(i):
+        save(i)
+        app.create_zip()
+    ops['create_zip_incremental'] = measure(zip_incremental, repeat)
+
+    def submit(i):
+        tipe = types[i % len(types)]
+        data = {k: str(v) for k, v in make_listing(app, rng, tipe, '').items() if k != 'no'}
+        data['gambar_cover'] = (io.BytesIO(upload), 'cover.jpg')
+        data['gambar_lainnya'] = [(io.BytesIO(upload), 'foto.jpg')]
+        client.post('/submit', data=data, content_type='multipart/form-data')
+        with client.session_transaction() as sess:
+            errors = [message for category, message in sess.pop('_flashes', []) if category == 'danger']
+        assert not errors, errors
+    ops['submit_endpoint'] = measure(submit, repeat)
+
+    results.put((backend, size, {'seed_seconds': round(seed_seconds, 2), 'operations': ops}))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold, min_ms):
+    """Lines for every operation whose median grew by more than threshold"""
+    regressions = []
+    for backend, sizes in report['results'].items():
+        for size, case in sizes.items():
+            base_case = baseline.get('results', {}).get(backend, {}).get(size)
+            if not base_case:
+                continue
+            for op, timing in case['operations'].items():
+                base = base_case['operations'].get(op)
+                # Sub-millisecond timings are mostly noise
+                if not base or max(base['median_ms'], timing['median_ms']) < min_ms:
+                    continue
+                ratio = timing['median_ms'] / base['median_ms']
+                if ratio > threshold:
+                    regressions.append(f'{backend:6} {size:>6} {op:24} {base["median_ms"]:>10.2f} -> '
+                                       f'{timing["median_ms"]:>10.2f} ms (x{ratio:.2f})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma-separated listing counts')
+    parser.add_argument('--backends', default='excel,sqlite', help='comma-separated: excel,sqlite')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per operation')
+    parser.add_argument('--output', default='bench_storage.json', help='where to write the JSON report')
+    parser.add_argument('--compare', help='baseline JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='flag operations slower than baseline by this factor')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='ignore operations faster than this in both reports')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {'commit': git_commit(), 'date': datetime.now().isoformat(timespec='seconds'),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'repeat': args.repeat},
+        'results': {},
+    }
+    ctx = multiprocessing.get_context('spawn')
+    for backend in args.backends.split(','):
+        for size in (int(s) for s in args.sizes.split(',')):
+            results = ctx.Queue()
+            proc = ctx.Process(target=run_case, args=(backend.strip(), size, args.repeat, results))
+            proc.start()
+            case = None
+            while case is None:
+                try:
+                    backend_name, size, case = results.get(timeout=1)
+                except queue.Empty:
+                    if not proc.is_alive():
+                        sys.exit(f'{backend} / {size} listings failed (exit code {proc.exitcode})')
+            proc.join()
+            report['results'].setdefault(backend_name, {})[str(size)] = case
+            print(f'\n{backend_name} / {size} listings (seeded in {case["seed_seconds"]}s)')
+            for op, timing in case['operations'].items():
+                print(f'  {op:24} median {timing["median_ms"]:>10.2f} ms   '
+                      f'min {timing["min_ms"]:>10.2f}   max {timing["max_ms"]:>10.2f}')
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nReport: {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_ms)
+        print(f'Compared with {args.compare} (commit {baseline.get("meta", {}).get("commit")}):')
+        for line in regressions:
+            print(f'  SLOWER {line}')
+        if regressions:
+            sys.exit(1)
+        print('  no regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""End-to-end load test against a gunicorn-served app.
+
+Starts mock_openai.py in-process, starts gunicorn on a fresh uploads/ folder
+with the OpenAI client pointed at the mock (OPENAI_BASE_URL), seeds a few
+listings and then lets N virtual agents loop over /submit, /update-data,
+/parse-description, /generate-listing and /download/zip for a fixed time.
+Reports p50/p95/p99 latency, errors and throughput per endpoint for every
+concurrency level, so the point where latency blows up is easy to spot.
+
+Usage:
+    python loadtest.py --concurrency 1,8,32 --duration 30 --workers 4
+    python loadtest.py --mock-latency-ms 2000 --mock-error-rate 0.05 --output load.json
+    python loadtest.py --url http://127.0.0.1:5000   # app already running (point it at the mock yourself)
+"""
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import httpx
+
+from mock_openai import MockSettings, make_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ('submit', 'update', 'parse', 'generate', 'zip')
+TIPE_LIST = ['rumah', 'ruko', 'tanah', 'apartemen']
+AREAS = ['Cibubur', 'Kelapa Gading', 'Bekasi', 'Depok', 'Bogor', 'Kuningan']
+DESCRIPTIONS = [
+    'Dijual rumah di {area} LT 120 LB 90 3KT 2KM harga 1,5M nego, SHM, semi furnished',
+    'Disewakan ruko 3 lantai di {area} 150jt/tahun, LT/LB 75/200, 2 KM, HGB',
+    'Dijual tanah kavling 500m2 di {area}, SHM, harga 2,5 jt/m2. 2 km dari tol',
+    'Sewa apartemen 2BR lantai 15 di {area}, furnished, Rp 8 juta per bulan',
+]
+
+
+def make_image():
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + b'\x00' * 4096 + b'\xff\xd9'
+    img = Image.frombytes('RGB', (320, 240), random.Random(1).randbytes(320 * 240 * 3))
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def flashed_errors(response):
+    """'danger' flash messages carried in the Flask session cookie of a redirect"""
+    cookie = response.cookies.get('session')
+    if not cookie:
+        return []
+    compressed = cookie.startswith('.')
+    payload = cookie.lstrip('.').split('.')[0]
+    try:
+        data = base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        session = json.loads(zlib.decompress(data) if compressed else data)
+    except (ValueError, zlib.error):
+        return []
+    flashes = session.get('_flashes', [])
+    # Flask's tagged JSON stores each (category, message) tuple as {" t": [...]}
+    flashes = [f.get(' t', f) if isinstance(f, dict) else f for f in flashes]
+    return [message for category, message in flashes if category == 'danger']
+
+
+class Agent:
+    """One simulated user: a keep-alive HTTP client and the request builders"""
+
+    def __init__(self, base_url, targets, image, parser_mode, rng):
+        self.client = httpx.Client(base_url=base_url, timeout=180, follow_redirects=False)
+        self.targets = targets
+        self.image = image
+        self.parser_mode = parser_mode
+        self.rng = rng
+
+    def listing_form(self, tipe):
+        return {
+            'tipe_properti': tipe,
+            'kategori': self.rng.choice(['dijual', 'disewa']),
+            'id_area': self.rng.choice(AREAS),
+            'harga': str(self.rng.randint(5, 500) * 10**7),
+            'judul_iklan': f'loadtest {tipe} {self.rng.randint(1, 10**6)}',
+            'deskripsi_iklan': 'Listing dari loadtest.py',
+            'status': 'Tayang',
+        }
+
+    def form_post(self, path, **kwargs):
+        # A fresh session per post keeps earlier flashes from leaking into this response
+        self.client.cookies.clear()
+        response = self.client.post(path, **kwargs)
+        if response.status_code != 302:
+            return False, f'HTTP {response.status_code}'
+        errors = flashed_errors(response)
+        return (False, errors[0][:120]) if errors else (True, None)
+
+    def submit(self):
+        tipe = self.rng.choice(TIPE_LIST)
+        return self.form_post('/submit', data=self.listing_form(tipe), files=[
+            ('gambar_cover', ('cover.jpg', self.image, 'image/jpeg')),
+            ('gambar_lainnya', ('foto.jpg', self.image, 'image/jpeg')),
+        ])
+
+    def update(self):
+        tipe, no = self.rng.choice(self.targets)
+        return self.form_post('/update-data', data={**self.listing_form(tipe), 'no': str(no)})
+
+    def json_post(self, path, payload):
+        response = self.client.post(path, json=payload)
+        if response.status_code != 200:
+            try:
+                return False, str(response.json().get('error'))[:120]
+            except ValueError:
+                return False, f'HTTP {response.status_code}'
+        return True, None
+
+    def parse(self):
+        description = self.rng.choice(DESCRIPTIONS).format(area=self.rng.choice(AREAS))
+        return self.json_post('/parse-description', {
+            'description': description, 'mode': self.parser_mode, 'no_cache': True,
+        })
+
+    def generate(self):
+        return self.json_post('/generate-listing', {**self.listing_form(self.rng.choice(TIPE_LIST)), 'no_cache': True})
+
+    def zip(self):
+        with self.client.stream('GET', '/download/zip') as response:
+            for _ in response.iter_bytes():
+                pass
+        if response.status_code != 200:
+            return False, f'HTTP {response.status_code}'
+        return True, None
+
+
+def run_level(base_url, concurrency, duration, mix, targets, image, parser_mode):
+    """Run `concurrency` agents for `duration` seconds; {endpoint: [(latency, ok, error)]}"""
+    samples = {endpoint: [] for endpoint in mix}
+    lock = threading.Lock()
+    endpoints, weights = zip(*mix.items())
+    deadline = time.monotonic() + duration
+
+    def agent_loop(seed):
+        rng = random.Random(seed)
+        agent = Agent(base_url, targets, image, parser_mode, rng)
+        try:
+            while time.monotonic() < deadline:
+                endpoint = rng.choices(endpoints, weights)[0]
+                start = time.perf_counter()
+                try:
+                    ok, error = getattr(agent, endpoint)()
+                except httpx.HTTPError as e:
+                    ok, error = False, f'{type(e).__name__}: {e}'[:120]
+                latency = time.perf_counter() - start
+                with lock:
+                    samples[endpoint].append((latency, ok, error))
+        finally:
+            agent.client.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=agent_loop, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    summary = {}
+    for endpoint, rows in samples.items():
+        latencies = sorted(latency * 1000 for latency, _, _ in rows)
+        errors = [error for _, ok, error in rows if not ok]
+        summary[endpoint] = {
+            'requests': len(rows),
+            'errors': len(errors),
+            'throughput_rps': round(len(rows) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+            'max_ms': round(latencies[-1], 1) if latencies else None,
+            'sample_errors': sorted(set(errors))[:3],
+        }
+    total = sum(len(rows) for rows in samples.values())
+    return {'elapsed_seconds': round(elapsed, 2), 'throughput_rps': round(total / elapsed, 2), 'endpoints': summary}
+
+
+def print_level(concurrency, result):
+    print(f'\nconcurrency {concurrency}: {result["throughput_rps"]} req/s over {result["elapsed_seconds"]}s')
+    print(f'  {"endpoint":10} {"reqs":>6} {"errors":>6} {"req/s":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for endpoint, row in result['endpoints'].items():
+        cells = [f'{row[key]:>9}' if row[key] is not None else f'{"-":>9}' for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms')]
+        print(f'  {endpoint:10} {row["requests"]:>6} {row["errors"]:>6} {row["throughput_rps"]:>7} ' + ' '.join(cells))
+        for error in row['sample_errors']:
+            print(f'      ! {error}')
+
+
+def start_gunicorn(workdir, port, mock_url, args):
+    env = {
+        **os.environ,
+        'OPENAI_BASE_URL': mock_url,
+        'OPENAI_API_KEY': 'mock-key',
+        'PARSER_MODE': args.parser_mode,
+    }
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    proc = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--pythonpath', REPO_DIR, '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers), '--threads', str(args.threads), '--timeout', '180',
+    ], cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'gunicorn exited with {proc.returncode}, see {log.name}')
+        try:
+            httpx.get(f'{base_url}/search?q=x', timeout=2)
+            return proc, base_url
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    proc.terminate()
+    raise SystemExit(f'gunicorn did not come up within 60s, see {log.name}')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f'unknown endpoint {name!r}, expected one of {", ".join(ENDPOINTS)}')
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def seed_listings(base_url, count, image, parser_mode):
+    """Submit `count` listings and return the (tipe, no) pairs /update-data can target"""
+    agent = Agent(base_url, [], image, parser_mode, random.Random(0))
+    try:
+        for _ in range(count):
+            ok, error = agent.submit()
+            if not ok:
+                print(f'Warning: seed submit failed: {error}')
+        results = agent.client.get('/search', params={'q': 'loadtest', 'limit': 1000}).json().get('results', [])
+    finally:
+        agent.client.close()
+    return [(row['tipe_properti'], row['no']) for row in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='load an already running app instead of starting gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated numbers of concurrent agents')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per concurrency level')
+    parser.add_argument('--mix', default='submit=3,update=2,parse=3,generate=2,zip=1',
+                        help='endpoint weights, from: ' + ', '.join(ENDPOINTS))
+    parser.add_argument('--seed', type=int, default=40, help='listings submitted before the run')
+    parser.add_argument('--parser-mode', default='ai', help='mode sent to /parse-description (ai, hybrid, offline)')
+    parser.add_argument('--mock-port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--mock-latency-ms', type=float, default=800)
+    parser.add_argument('--mock-jitter-ms', type=float, default=200)
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--mock-rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    settings = MockSettings(args.mock_latency_ms, args.mock_jitter_ms,
+                            args.mock_error_rate, args.mock_rate_limit_rate, seed=0)
+    mock = make_server('127.0.0.1', args.mock_port or free_port(), settings)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    mock_url = f'http://127.0.0.1:{mock.server_address[1]}/v1'
+    print(f'Mock OpenAI: {mock_url} (latency {args.mock_latency_ms}±{args.mock_jitter_ms} ms, '
+          f'errors {args.mock_error_rate:.0%}, 429 {args.mock_rate_limit_rate:.0%})')
+
+    gunicorn = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        workdir = tempfile.mkdtemp(prefix='loadtest_')
+        gunicorn, base_url = start_gunicorn(workdir, free_port(), mock_url, args)
+        print(f'gunicorn: {base_url} ({args.workers} workers x {args.threads} threads), workdir {workdir}')
+
+    report = {
+        'meta': {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'url': base_url, 'workers': args.workers,
+                 'threads': args.threads, 'duration': args.duration, 'mix': mix,
+                 'mock': {'latency_ms': args.mock_latency_ms, 'jitter_ms': args.mock_jitter_ms,
+                          'error_rate': args.mock_error_rate, 'rate_limit_rate': args.mock_rate_limit_rate}},
+        'levels': {},
+    }
+    try:
+        image = make_image()
+        targets = seed_listings(base_url, args.seed, image, args.parser_mode)
+        if 'update' in mix and not targets:
+            print('Warning: no seeded listings found via /search, skipping /update-data')
+            mix.pop('update')
+        print(f'Seeded {len(targets)} listings')
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            samples, elapsed = run_level(base_url, concurrency, args.duration, mix, targets, image, args.parser_mode)
+            result = summarize(samples, elapsed)
+            report['levels'][str(concurrency)] = result
+            print_level(concurrency, result)
+    finally:
+        if gunicorn:
+            gunicorn.terminate()
+            gunicorn.wait(timeout=30)
+        mock.shutdown()
+
+    report['mock_calls'] = dict(settings.counts)
+    print(f'\nMock OpenAI calls: {settings.counts}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions (plain and stream=true) with a canned JSON
+listing after a configurable delay, and fails a configurable share of the
+calls with 500/429, so the AI endpoints can be load-tested without an API
+key or cost. Point the app at it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=mock python app.py
+
+Usage:
+    python mock_openai.py --port 8100 --latency-ms 800 --jitter-ms 300 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Keys of both the parser and the listing generator, so one answer fits every prompt
+CANNED_CONTENT = {
+    'tipe_properti': 'rumah',
+    'kategori': 'dijual',
+    'id_area': 'Cibubur',
+    'harga': 1500000000,
+    'luas_tanah': 120,
+    'luas_bangunan': 90,
+    'kamar_tidur': 3,
+    'kamar_mandi': 2,
+    'sertifikat': 'SHM',
+    'judul_iklan': 'Rumah Siap Huni di Cibubur, Akses Tol Dekat',
+    'kalimat_pembuka': 'Hunian nyaman untuk keluarga di lingkungan yang asri.',
+    'deskripsi_iklan': 'Rumah 2 lantai dengan 3 kamar tidur dan 2 kamar mandi, SHM, bebas banjir, '
+                       'dekat sekolah dan pusat perbelanjaan.',
+}
+
+
+class MockSettings:
+    def __init__(self, latency_ms, jitter_ms, error_rate, rate_limit_rate, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'rate_limited': 0}
+
+    def draw(self):
+        """(delay in seconds, status code) for the next call"""
+        with self.lock:
+            self.counts['requests'] += 1
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self.rng.random()
+            if roll < self.error_rate:
+                self.counts['errors'] += 1
+                return delay, 500
+            if roll < self.error_rate + self.rate_limit_rate:
+                self.counts['rate_limited'] += 1
+                return delay, 429
+            return delay, 200
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            return self.send_json(200, self.settings.counts)
+        self.send_json(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request_body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.send_json(400, {'error': {'message': 'invalid JSON', 'type': 'invalid_request_error'}})
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self.send_json(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+
+        delay, status = self.settings.draw()
+        time.sleep(delay)
+        if status == 429:
+            return self.send_json(429, {'error': {'message': 'Rate limit reached (mock)', 'type': 'rate_limit_error'}},
+                                  headers={'Retry-After': '0'})
+        if status != 200:
+            return self.send_json(status, {'error': {'message': 'Internal server error (mock)', 'type': 'server_error'}})
+
+        model = request_body.get('model', 'mock')
+        content = json.dumps(CANNED_CONTENT, ensure_ascii=False)
+        # Rough token counts (~4 characters per token) so usage metrics have something to add up
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in request_body.get('messages', [])) // 4
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4,
+                 'total_tokens': prompt_tokens + len(content) // 4}
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        if request_body.get('stream'):
+            return self.send_stream(completion_id, model, content,
+                                    usage if (request_body.get('stream_options') or {}).get('include_usage') else None)
+        self.send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': usage,
+        })
+
+    def send_stream(self, completion_id, model, content, usage=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        pieces = [content[i:i + 40] for i in range(0, len(content), 40)]
+        for index, piece in enumerate(pieces + [None]):
+            chunk = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': piece} if piece is not None else {},
+                             'finish_reason': None if piece is not None else 'stop'}],
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+        if usage:
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': model, 'choices': [], 'usage': usage}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.close_connection = True
+
+
+def make_server(host, port, settings):
+    handler = type('Handler', (MockOpenAIHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=float, default=800, help='mean response delay')
+    parser.add_argument('--jitter-ms', type=float, default=200, help='delay varies uniformly by +/- this much')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of calls answered with 429')
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    server = make_server(args.host, args.port, settings)
+    print(f'Mock OpenAI on http://{args.host}:{args.port}/v1 '
+          f'(latency {args.latency_ms}±{args.jitter_ms} ms, errors {args.error_rate:.0%}, 429 {args.rate_limit_rate:.0%})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Stress check for concurrent writers.
+
+Starts several processes (like gunicorn workers) that all hit /submit at the
+same moment against a fresh uploads/ folder, then verifies that N submits
+produced exactly N rows, N distinct numbers, N upload folders and a ZIP with
+every cover image.
+
+Usage:
+    python stress_submit.py --workers 8 --submits 10
+    STORAGE_BACKEND=sqlite python stress_submit.py
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import zipfile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TIPE_LIST = ['rumah', 'ruko', 'tanah', 'apartemen']
+# Smallest valid-looking JPEG payload; content doesn't matter for storage
+FAKE_JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 512 + b'\xff\xd9'
+
+
+def run_worker(workdir, worker_id, submits, barrier, results):
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    import app
+
+    client = app.app.test_client()
+    barrier.wait()
+    errors = []
+    for i in range(submits):
+        tipe = TIPE_LIST[(worker_id + i) % len(TIPE_LIST)]
+        client.post('/submit', content_type='multipart/form-data', data={
+            'tipe_properti': tipe,
+            'kategori': 'dijual',
+            'judul_iklan': f'stress {worker_id}-{i}',
+            'gambar_cover': (io.BytesIO(FAKE_JPEG), 'cover.jpg'),
+            'gambar_lainnya': [(io.BytesIO(FAKE_JPEG), 'foto.jpg')],
+        })
+        with client.session_transaction() as sess:
+            for category, message in sess.pop('_flashes', []):
+                if category == 'danger':
+                    errors.append(message)
+    results.put((worker_id, errors))
+
+
+def verify(workdir, expected):
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    import app
+
+    problems = []
+    rows = app.read_excel_data()
+    keys = {app.listing_key(r.get('tipe properti'), r.get('no')) for r in rows}
+    folders = [
+        (tipe, no)
+        for tipe in TIPE_LIST if os.path.isdir(os.path.join(app.UPLOAD_FOLDER, tipe))
+        for no in os.listdir(os.path.join(app.UPLOAD_FOLDER, tipe))
+    ]
+    if len(rows) != expected:
+        problems.append(f'{len(rows)} rows, expected {expected}')
+    if len(keys) != expected:
+        problems.append(f'{len(keys)} distinct (tipe, no), expected {expected}')
+    if len(folders) != expected:
+        problems.append(f'{len(folders)} upload folders, expected {expected}')
+
+    if app.ARCHIVE_MODE != 'lazy':
+        app.create_zip()
+        with zipfile.ZipFile(app.get_current_zip_file()) as zipf:
+            covers = [n for n in zipf.namelist() if n.endswith('/cover.jpg')]
+            if len(covers) != expected:
+                problems.append(f'{len(covers)} covers in ZIP, expected {expected}')
+            if zipf.testzip() is not None:
+                problems.append('ZIP is corrupt')
+
+    print(f'rows={len(rows)} distinct={len(keys)} folders={len(folders)} '
+          f'backend={app.STORAGE_BACKEND} archive={app.ARCHIVE_MODE}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8, help='concurrent processes')
+    parser.add_argument('--submits', type=int, default=10, help='submits per process')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='stress_submit_')
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(args.workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=run_worker, args=(workdir, i, args.submits, barrier, results))
+        for i in range(args.workers)
+    ]
+    for proc in procs:
+        proc.start()
+    errors = []
+    for _ in procs:
+        errors.extend(results.get()[1])
+    for proc in procs:
+        proc.join()
+
+    problems = [f'submit failed: {message}' for message in errors]
+    problems += verify(workdir, args.workers * args.submits)
+    print(f'workdir: {workdir}')
+    if problems:
+        for problem in problems:
+            print(f'FAIL: {problem}')
+        sys.exit(1)
+    print(f'OK: {args.workers * args.submits} concurrent submits')
+
+
+if __name__ == '__main__':
+    main()